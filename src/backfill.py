@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Backfill tool that bulk-loads file output and spooled points into InfluxDB.
+
+Replays the emeter_*/sysinfo_* files in KASA_COLLECTOR_OUTPUT_DIR (JSON Lines,
+rotated .gz/.zst segments and older pretty-printed .json files) and,
+optionally, the InfluxDB spool, keeping the original sample timestamps.
+Points are built exactly as the collector builds them, so a replayed point
+overwrites rather than duplicates one InfluxDB already has.
+
+Progress is checkpointed per file, keyed on the file's first record rather
+than its path, so an interrupted run resumes where it stopped even after the
+file sink has rotated the file it was reading.
+"""
+
+import argparse
+import asyncio
+import glob
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Iterator, Optional
+
+from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+from config import Config
+from logging_utils import configure_logging
+from file_sink import ACTIVE_SUFFIX
+from influxdb_storage import InfluxDBStorage
+from spool import SEGMENT_PREFIX, SEGMENT_SUFFIX
+from utils import ns_from_datetime
+
+try:
+    import zstandard
+except ImportError:  # Only needed for .zst segments
+    zstandard = None
+
+type Checkpoint = dict[str, dict[str, Any]]  # key -> {"path", "records", "size", "done"}
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger("Backfill")
+
+DEFAULT_CHECKPOINT = "state/backfill_checkpoint.json"
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_SIZE = 10000
+
+# Attempts per batch before a file is given up on, with exponential backoff
+WRITE_ATTEMPTS = 5
+WRITE_TIMEOUT_MS = 60000
+
+
+def _open_text(path: str):
+    """Open a plain, gzip or zstd compressed file for reading text."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(
+                "reading .zst files requires the zstandard package "
+                "(pip install zstandard)"
+            )
+        return io.TextIOWrapper(
+            zstandard.ZstdDecompressor().stream_reader(open(path, "rb")),
+            encoding="utf-8",
+        )
+    return open(path, encoding="utf-8")
+
+
+def _read_json_lines(path: str) -> Iterator[Optional[dict]]:
+    """
+    Yield the records of a JSON Lines file. Unreadable lines, such as one
+    cut short by a crash, yield None so they still count toward progress.
+    """
+    with _open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping malformed record in {path}")
+                yield None
+
+
+def _read_legacy_json(path: str, interval: int) -> Iterator[dict]:
+    """
+    Yield the records of an older output file holding pretty-printed JSON
+    documents back to back. These records carry no timestamp, so each device
+    series is assumed to have been written every interval seconds, ending at
+    the file's modification time.
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    decoder = json.JSONDecoder()
+    records = []
+    index = 0
+    while True:
+        while index < len(text) and text[index].isspace():
+            index += 1
+        if index >= len(text):
+            break
+        record, index = decoder.raw_decode(text, index)
+        records.append(record)
+
+    # Count back from the last record of each (ip, plug_alias) series
+    remaining: dict[tuple, int] = {}
+    for record in records:
+        for ip, data in record.items():
+            key = (ip, data.get("plug_alias"))
+            remaining[key] = remaining.get(key, 0) + 1
+    end = datetime.fromtimestamp(os.path.getmtime(path)).astimezone()
+    for record in records:
+        for ip, data in record.items():
+            key = (ip, data.get("plug_alias"))
+            remaining[key] -= 1
+            stamp = end - timedelta(seconds=remaining[key] * interval)
+            data.setdefault("time", stamp.isoformat())
+
+    yield from records
+
+
+def _file_key(path: str) -> Optional[str]:
+    """
+    Return the checkpoint key of a file, or None if it has no records yet.
+
+    JSON Lines files and spool segments are keyed on a hash of their first
+    line. Rotation renames and compresses the active file but keeps its
+    content, so a rotated segment keeps the progress made while it was
+    active, and the fresh active file that takes over its path starts from
+    the beginning. Older .json files are never rotated and keep their path.
+    """
+    if path.endswith(".json"):
+        return path
+    with _open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                return "sha1:" + hashlib.sha1(line.encode("utf-8")).hexdigest()
+    return None
+
+
+def _read_lines(path: str) -> Iterator[str]:
+    """Yield the line protocol records of a spool segment."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line:
+                yield line
+
+
+class Backfill:
+    """
+    Replays output files and spool segments into InfluxDB.
+
+    Files are processed by a pool of workers, one file per worker at a time.
+    Sysinfo files are replayed before emeter files so emeter points get the
+    device_id and plug_id tags. Each batch is written as one gzip-compressed
+    request and the checkpoint is saved after every batch.
+    """
+
+    def __init__(
+        self,
+        storage: InfluxDBStorage,
+        write_api,
+        checkpoint_path: str = DEFAULT_CHECKPOINT,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        workers: int = DEFAULT_WORKERS,
+    ):
+        self.storage = storage
+        self.write_api = write_api
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint: Checkpoint = self._load_checkpoint()
+
+        # Totals reported at the end of the run
+        self.files = 0
+        self.records = 0
+        self.points = 0
+        self.skipped = 0
+        self.failed: list[str] = []
+
+    def _load_checkpoint(self) -> Checkpoint:
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            logger.info(f"Resuming from checkpoint {self.checkpoint_path}")
+            return checkpoint
+        except FileNotFoundError:
+            return {}
+
+    def _save_checkpoint(self):
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _records(self, path: str) -> Iterator[Any]:
+        """Return an iterator over the records of a file."""
+        if path.endswith(SEGMENT_SUFFIX):
+            return _read_lines(path)
+        if path.endswith(".json"):
+            interval = (
+                Config.KASA_COLLECTOR_SYSINFO_FETCH_INTERVAL
+                if os.path.basename(path).startswith("sysinfo_")
+                else Config.KASA_COLLECTOR_DATA_FETCH_INTERVAL
+            )
+            return _read_legacy_json(path, interval)
+        return _read_json_lines(path)
+
+    async def _to_lines(self, path: str, records: list) -> list[str]:
+        """Turn a batch of records into line protocol."""
+        if path.endswith(SEGMENT_SUFFIX):
+            return records
+
+        kind = "sysinfo" if os.path.basename(path).startswith("sysinfo_") else "emeter"
+        samples = []
+        for record in records:
+            for ip, data in (record or {}).items():
+                if not data.get("time"):
+                    self.skipped += 1
+                    continue
+                timestamp = ns_from_datetime(datetime.fromisoformat(data.pop("time")))
+                samples.append({"kind": kind, "data": {ip: data}, "time": timestamp})
+        points = await self.storage.build_points(samples)
+        return [
+            point if isinstance(point, str) else point.to_line_protocol()
+            for point in points
+        ]
+
+    async def _write(self, lines: list[str]):
+        """Write a batch, retrying with backoff."""
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                await self.write_api.write(bucket=self.storage.bucket, record=lines)
+                self.points += len(lines)
+                return
+            except Exception as e:
+                if attempt == WRITE_ATTEMPTS - 1:
+                    raise
+                delay = 2**attempt
+                logger.warning(f"Write of {len(lines)} points failed: {e}")
+                logger.warning(f"Retrying in {delay} seconds")
+                await asyncio.sleep(delay)
+
+    async def replay_file(self, path: str):
+        """
+        Replay one file from its checkpoint, saving progress after each batch.
+        """
+        key = await asyncio.to_thread(_file_key, path)
+        if key is None:
+            return
+        size = os.path.getsize(path)
+        progress = self.checkpoint.setdefault(
+            key, {"path": path, "records": 0, "size": 0, "done": False}
+        )
+        if progress["path"] == path and size < progress["size"]:
+            # Same first record but less data than before: the file was
+            # truncated and rewritten, so the saved offset means nothing
+            logger.warning(f"{path} has shrunk since the last run; replaying it")
+            progress.update(records=0, done=False)
+        progress.update(path=path, size=size)
+        if progress["done"]:
+            return
+
+        records = islice(self._records(path), progress["records"], None)
+        while True:
+            batch = await asyncio.to_thread(
+                lambda: list(islice(records, self.batch_size))
+            )
+            if not batch:
+                break
+            lines = await self._to_lines(path, batch)
+            if lines:
+                await self._write(lines)
+            progress["records"] += len(batch)
+            self.records += len(batch)
+            self._save_checkpoint()
+
+        # The active .jsonl file keeps growing, so a later run picks up from
+        # the last record instead of treating it as finished
+        progress["done"] = not path.endswith(ACTIVE_SUFFIX)
+        self._save_checkpoint()
+        self.files += 1
+        logger.info(f"Replayed {path} ({progress['records']} records)")
+
+    async def _worker(self, queue: asyncio.Queue):
+        while not queue.empty():
+            path = queue.get_nowait()
+            try:
+                await self.replay_file(path)
+            except Exception as e:
+                self.failed.append(path)
+                logger.error(f"Failed to replay {path}: {e}")
+
+    async def run(self, *phases: list[str]):
+        """
+        Replay each phase's files in parallel, one phase after another.
+        """
+        for paths in phases:
+            queue: asyncio.Queue[str] = asyncio.Queue()
+            for path in paths:
+                queue.put_nowait(path)
+            await asyncio.gather(
+                *(self._worker(queue) for _ in range(min(self.workers, len(paths))))
+            )
+
+
+def find_output_files(output_dir: str, kind: str, legacy: bool = False) -> list[str]:
+    """
+    Return the output files of one kind, oldest first. Older .json files are
+    only included when legacy is set, since their records have no timestamp.
+    """
+    patterns = ["*.jsonl", "*.jsonl.gz", "*.jsonl.zst"]
+    if legacy:
+        patterns.append("*.json")
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(os.path.join(output_dir, f"{kind}_{pattern}")))
+    return sorted(paths, key=os.path.getmtime)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Bulk-load Kasa Collector file output into InfluxDB."
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=Config.KASA_COLLECTOR_OUTPUT_DIR,
+        help="directory holding emeter_*/sysinfo_* files (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--spool",
+        action="store_true",
+        help="also replay the InfluxDB spool in KASA_COLLECTOR_SPOOL_DIR",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=DEFAULT_CHECKPOINT,
+        help="progress file used to resume (default: %(default)s)",
+    )
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--estimate-legacy-times",
+        action="store_true",
+        help="also replay old .json files, timestamping their records from the "
+        "fetch intervals and the file's modification time",
+    )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+
+    missing = [
+        name
+        for name, value in {
+            "KASA_COLLECTOR_INFLUXDB_URL": Config.KASA_COLLECTOR_INFLUXDB_URL,
+            "KASA_COLLECTOR_INFLUXDB_TOKEN": Config.KASA_COLLECTOR_INFLUXDB_TOKEN,
+            "KASA_COLLECTOR_INFLUXDB_ORG": Config.KASA_COLLECTOR_INFLUXDB_ORG,
+            "KASA_COLLECTOR_INFLUXDB_BUCKET": Config.KASA_COLLECTOR_INFLUXDB_BUCKET,
+        }.items()
+        if not value
+    ]
+    if missing:
+        logger.error(f"Missing required configurations: {', '.join(missing)}")
+        raise SystemExit(1)
+
+    legacy = args.estimate_legacy_times
+    sysinfo_files = find_output_files(args.output_dir, "sysinfo", legacy)
+    emeter_files = find_output_files(args.output_dir, "emeter", legacy)
+    if args.spool:
+        emeter_files += sorted(
+            glob.glob(
+                os.path.join(
+                    Config.KASA_COLLECTOR_SPOOL_DIR,
+                    "influxdb",
+                    f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}",
+                )
+            )
+        )
+    logger.info(
+        f"Found {len(sysinfo_files)} sysinfo and {len(emeter_files)} emeter/spool "
+        f"files to replay"
+    )
+
+    # Validates the connection and bucket, and builds points like the collector
+    storage = InfluxDBStorage()
+    try:
+        async with InfluxDBClientAsync(
+            url=Config.KASA_COLLECTOR_INFLUXDB_URL,
+            token=Config.KASA_COLLECTOR_INFLUXDB_TOKEN,
+            org=Config.KASA_COLLECTOR_INFLUXDB_ORG,
+            enable_gzip=True,
+            timeout=WRITE_TIMEOUT_MS,
+        ) as client:
+            backfill = Backfill(
+                storage,
+                client.write_api(),
+                checkpoint_path=args.checkpoint,
+                batch_size=args.batch_size,
+                workers=args.workers,
+            )
+            await backfill.run(sysinfo_files, emeter_files)
+    finally:
+        storage.client.close()
+
+    logger.info(
+        f"Replayed {backfill.files} files, {backfill.records} records, "
+        f"{backfill.points} points"
+    )
+    if backfill.skipped:
+        logger.warning(f"Skipped {backfill.skipped} records without a timestamp")
+    if backfill.failed:
+        logger.error(f"{len(backfill.failed)} files failed; rerun to resume them")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Interrupted; rerun to resume from the checkpoint.")
+        sys.exit(130)
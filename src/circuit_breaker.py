@@ -0,0 +1,157 @@
+"""
+Per-device circuit breaker.
+Moves devices that keep failing into quarantine, where they are re-probed on
+a growing backoff instead of being polled (and retried) every cycle.
+"""
+
+import logging
+import time
+from typing import Optional
+
+from config import Config
+
+type BreakerStats = dict[str, int]
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceHealth:
+    """
+    Failure tracking for a single device.
+    """
+
+    __slots__ = ("failures", "quarantined", "probe_delay", "next_probe")
+
+    def __init__(self):
+        self.failures = 0  # Consecutive failed polls
+        self.quarantined = False
+        self.probe_delay = 0.0
+        self.next_probe = 0.0
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive poll failures per device.
+
+    After failure_threshold failed polls in a row a device is quarantined:
+    it is left out of the poll schedule and probed once per backoff period
+    instead. The backoff starts at base_delay and doubles after each failed
+    probe, up to max_delay. A successful probe releases the device back to
+    normal polling.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: Optional[int] = None,
+        base_delay: Optional[float] = None,
+        max_delay: Optional[float] = None,
+        clock=time.monotonic,
+    ):
+        if failure_threshold is None:
+            failure_threshold = Config.KASA_COLLECTOR_BREAKER_FAILURE_THRESHOLD
+        if base_delay is None:
+            base_delay = Config.KASA_COLLECTOR_QUARANTINE_BASE_DELAY
+        if max_delay is None:
+            max_delay = Config.KASA_COLLECTOR_QUARANTINE_MAX_DELAY
+
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max(max_delay, base_delay)
+        self._clock = clock
+        self._devices: dict[str, DeviceHealth] = {}
+
+        # Counters exported through stats()
+        self.quarantines = 0
+        self.recoveries = 0
+        self.probes = 0
+        self.failed_probes = 0
+
+    def is_quarantined(self, key: str) -> bool:
+        """Return True if the device is currently quarantined."""
+        health = self._devices.get(key)
+        return health is not None and health.quarantined
+
+    def record_success(self, key: str):
+        """Reset the failure count after a successful poll."""
+        health = self._devices.get(key)
+        if health is not None and not health.quarantined:
+            health.failures = 0
+
+    def record_failure(self, key: str):
+        """
+        Count a failed poll and quarantine the device once it reaches the
+        failure threshold.
+        """
+        health = self._devices.setdefault(key, DeviceHealth())
+        if health.quarantined:
+            return
+        health.failures += 1
+        if health.failures >= self.failure_threshold:
+            health.quarantined = True
+            health.probe_delay = self.base_delay
+            health.next_probe = self._clock() + health.probe_delay
+            self.quarantines += 1
+            logger.warning(
+                f"Device {key} failed {health.failures} polls in a row, "
+                f"quarantined. Next probe in {health.probe_delay:.0f} seconds."
+            )
+
+    def due_probes(self) -> list[str]:
+        """Return quarantined devices whose next probe is due."""
+        now = self._clock()
+        return [
+            key
+            for key, health in self._devices.items()
+            if health.quarantined and health.next_probe <= now
+        ]
+
+    def seconds_until_next_probe(self) -> Optional[float]:
+        """Return seconds until the earliest probe, or None if none are pending."""
+        pending = [
+            health.next_probe
+            for health in self._devices.values()
+            if health.quarantined
+        ]
+        if not pending:
+            return None
+        return max(0.0, min(pending) - self._clock())
+
+    def record_probe(self, key: str, success: bool):
+        """
+        Record a probe result. Success releases the device from quarantine,
+        failure doubles its probe delay.
+        """
+        health = self._devices.get(key)
+        if health is None or not health.quarantined:
+            return
+        self.probes += 1
+        if success:
+            self._devices.pop(key)
+            self.recoveries += 1
+            logger.info(f"Device {key} responded to probe, leaving quarantine.")
+        else:
+            self.failed_probes += 1
+            health.probe_delay = min(health.probe_delay * 2, self.max_delay)
+            health.next_probe = self._clock() + health.probe_delay
+            logger.debug(
+                f"Probe of quarantined device {key} failed. "
+                f"Next probe in {health.probe_delay:.0f} seconds."
+            )
+
+    def forget(self, key: str):
+        """Drop all state for a device that is no longer managed."""
+        self._devices.pop(key, None)
+
+    def stats(self) -> BreakerStats:
+        """
+        Get circuit breaker statistics for export as self-monitoring metrics.
+        """
+        return {
+            "quarantined": sum(
+                1 for health in self._devices.values() if health.quarantined
+            ),
+            "quarantines": self.quarantines,
+            "recoveries": self.recoveries,
+            "probes": self.probes,
+            "failed_probes": self.failed_probes,
+        }
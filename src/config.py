@@ -1,3 +1,4 @@
+import ipaddress
 import os
 import sys
 from typing import Optional
@@ -46,6 +47,73 @@ def _get_log_level(env_var: str, default: str = "INFO") -> str:
     return value
 
 
+def _get_choice_config(env_var: str, choices: set[str], default: str) -> str:
+    """
+    Safely get a configuration value restricted to a set of choices.
+    """
+    value = os.getenv(env_var, default).lower()
+    if value not in choices:
+        print(f"ERROR: Invalid value '{value}' for {env_var}. ")
+        print(f"Valid values: {', '.join(sorted(choices))}")
+        sys.exit(1)
+    return value
+
+
+def _get_mapping_config(env_var: str, choices: set[str]) -> dict[str, str]:
+    """
+    Safely get a comma-separated list of key=value pairs from an environment
+    variable, with every value restricted to a set of choices.
+    """
+    value = os.getenv(env_var, "")
+    result = {}
+    for pair in filter(None, (item.strip() for item in value.split(","))):
+        key, sep, choice = pair.partition("=")
+        choice = choice.strip().lower()
+        if not sep or not key.strip() or choice not in choices:
+            print(f"ERROR: Invalid entry '{pair}' for {env_var}. ")
+            print(f"Expected key=value with value one of: {', '.join(sorted(choices))}")
+            sys.exit(1)
+        result[key.strip()] = choice
+    return result
+
+
+def _get_network_list_config(env_var: str) -> list[ipaddress.IPv4Network]:
+    """
+    Safely get a comma-separated list of IPv4 networks in CIDR notation.
+    """
+    value = os.getenv(env_var, "")
+    result = []
+    for item in filter(None, (item.strip() for item in value.split(","))):
+        try:
+            network = ipaddress.IPv4Network(item, strict=False)
+        except ValueError:
+            print(f"ERROR: Invalid network '{item}' for {env_var}. ")
+            print("Expected IPv4 CIDR notation, e.g. 192.168.1.0/24")
+            sys.exit(1)
+        if network not in result:
+            result.append(network)
+    return result
+
+
+def _get_list_config(env_var: str, choices: set[str], default: str) -> list[str]:
+    """
+    Safely get a comma-separated list of values restricted to a set of choices.
+    """
+    value = os.getenv(env_var, default)
+    result = []
+    for item in filter(None, (item.strip().lower() for item in value.split(","))):
+        if item not in choices:
+            print(f"ERROR: Invalid value '{item}' for {env_var}. ")
+            print(f"Valid values: {', '.join(sorted(choices))}")
+            sys.exit(1)
+        if item not in result:
+            result.append(item)
+    if not result:
+        print(f"ERROR: {env_var} must name at least one value")
+        sys.exit(1)
+    return result
+
+
 class Config:
     """Configuration settings for Kasa Collector loaded from environment variables."""
 
@@ -57,6 +125,50 @@ class Config:
     # Directory where output files will be saved. Default is "output".
     KASA_COLLECTOR_OUTPUT_DIR = os.getenv("KASA_COLLECTOR_OUTPUT_DIR", "output")
 
+    # Rotate an output file once it reaches this size (MB) or age (seconds)
+    KASA_COLLECTOR_FILE_ROTATE_SIZE_MB = _get_int_config(
+        "KASA_COLLECTOR_FILE_ROTATE_SIZE_MB", default=64, min_value=1
+    )
+
+    KASA_COLLECTOR_FILE_ROTATE_INTERVAL = _get_int_config(
+        "KASA_COLLECTOR_FILE_ROTATE_INTERVAL", default=86400, min_value=60
+    )
+
+    # Output files kept open at once (two per device or strip outlet)
+    KASA_COLLECTOR_FILE_MAX_OPEN_FILES = _get_int_config(
+        "KASA_COLLECTOR_FILE_MAX_OPEN_FILES", default=512, min_value=2
+    )
+
+    # Compression for rotated output files: gzip, zstd or none
+    KASA_COLLECTOR_FILE_COMPRESSION = _get_choice_config(
+        "KASA_COLLECTOR_FILE_COMPRESSION", {"gzip", "zstd", "none"}, default="gzip"
+    )
+
+    # Parquet archive: directory, the period each file covers (hour or
+    # day) and the column compression
+    KASA_COLLECTOR_PARQUET_DIR = os.getenv("KASA_COLLECTOR_PARQUET_DIR", "archive")
+
+    KASA_COLLECTOR_PARQUET_PERIOD = _get_choice_config(
+        "KASA_COLLECTOR_PARQUET_PERIOD", {"hour", "day"}, default="hour"
+    )
+
+    KASA_COLLECTOR_PARQUET_COMPRESSION = _get_choice_config(
+        "KASA_COLLECTOR_PARQUET_COMPRESSION",
+        {"zstd", "snappy", "gzip", "none"},
+        default="zstd",
+    )
+
+    # Buffered samples are written as a part file once a partition holds
+    # this many rows or its oldest row is this many seconds old; the parts
+    # are merged into one file when the period ends
+    KASA_COLLECTOR_PARQUET_FLUSH_ROWS = _get_int_config(
+        "KASA_COLLECTOR_PARQUET_FLUSH_ROWS", default=10000, min_value=100
+    )
+
+    KASA_COLLECTOR_PARQUET_FLUSH_INTERVAL = _get_int_config(
+        "KASA_COLLECTOR_PARQUET_FLUSH_INTERVAL", default=300, min_value=10
+    )
+
     # Retry and timeout settings
     KASA_COLLECTOR_FETCH_MAX_RETRIES = _get_int_config(
         "KASA_COLLECTOR_FETCH_MAX_RETRIES", default=5, min_value=1
@@ -79,6 +191,29 @@ class Config:
         "KASA_COLLECTOR_DISCOVERY_PACKETS", default=3, min_value=1
     )
 
+    # Probe these networks with unicast requests instead of broadcasting
+    KASA_COLLECTOR_DISCOVERY_SUBNETS = _get_network_list_config(
+        "KASA_COLLECTOR_DISCOVERY_SUBNETS"
+    )
+
+    KASA_COLLECTOR_DISCOVERY_PROBE_RATE = _get_int_config(
+        "KASA_COLLECTOR_DISCOVERY_PROBE_RATE", default=50, min_value=1
+    )
+
+    # Probes in flight at once, on a limit of their own so a sweep of mostly
+    # empty addresses can't hold the request slots that polling needs
+    KASA_COLLECTOR_DISCOVERY_MAX_PROBES = _get_int_config(
+        "KASA_COLLECTOR_DISCOVERY_MAX_PROBES", default=16, min_value=1
+    )
+
+    KASA_COLLECTOR_DISCOVERY_SWEEP_SIZE = _get_int_config(
+        "KASA_COLLECTOR_DISCOVERY_SWEEP_SIZE", default=256, min_value=1
+    )
+
+    KASA_COLLECTOR_DISCOVERY_LIVE_RECHECK_INTERVAL = _get_int_config(
+        "KASA_COLLECTOR_DISCOVERY_LIVE_RECHECK_INTERVAL", default=3600, min_value=60
+    )
+
     # Data collection intervals
     KASA_COLLECTOR_DATA_FETCH_INTERVAL = _get_int_config(
         "KASA_COLLECTOR_DATA_FETCH_INTERVAL", default=15, min_value=1
@@ -88,11 +223,85 @@ class Config:
         "KASA_COLLECTOR_SYSINFO_FETCH_INTERVAL", default=60, min_value=1
     )
 
+    # What a device does when a poll runs past its next deadline:
+    # skip missed slots or catch_up by polling them back-to-back
+    KASA_COLLECTOR_OVERRUN_POLICY = _get_choice_config(
+        "KASA_COLLECTOR_OVERRUN_POLICY", {"skip", "catch_up"}, default="skip"
+    )
+
+    # Per-device overrides, e.g. "192.168.1.10=catch_up,192.168.1.11=skip"
+    KASA_COLLECTOR_DEVICE_OVERRUN_POLICIES = _get_mapping_config(
+        "KASA_COLLECTOR_DEVICE_OVERRUN_POLICIES", {"skip", "catch_up"}
+    )
+
+    # Maximum device requests in flight at once, shared by polling and
+    # discovery/authentication
+    KASA_COLLECTOR_MAX_CONCURRENT_REQUESTS = _get_int_config(
+        "KASA_COLLECTOR_MAX_CONCURRENT_REQUESTS", default=32, min_value=1
+    )
+
+    # Quarantine a device after this many failed polls in a row
+    KASA_COLLECTOR_BREAKER_FAILURE_THRESHOLD = _get_int_config(
+        "KASA_COLLECTOR_BREAKER_FAILURE_THRESHOLD", default=3, min_value=1
+    )
+
+    # Quarantined devices are probed after this delay (seconds), doubling
+    # after each failed probe up to the maximum
+    KASA_COLLECTOR_QUARANTINE_BASE_DELAY = _get_int_config(
+        "KASA_COLLECTOR_QUARANTINE_BASE_DELAY", default=60, min_value=1
+    )
+
+    KASA_COLLECTOR_QUARANTINE_MAX_DELAY = _get_int_config(
+        "KASA_COLLECTOR_QUARANTINE_MAX_DELAY", default=3600, min_value=1
+    )
+
+    # Give each device a fixed phase offset within the data fetch interval so
+    # polls are spread out instead of all firing at once
+    KASA_COLLECTOR_SPREAD_POLLS = _get_bool_config(
+        "KASA_COLLECTOR_SPREAD_POLLS", default=True
+    )
+
+    # Sample timestamps are taken when a device reading returns and truncated
+    # to this precision (s, ms, us or ns)
+    KASA_COLLECTOR_TIMESTAMP_PRECISION = _get_choice_config(
+        "KASA_COLLECTOR_TIMESTAMP_PRECISION", {"s", "ms", "us", "ns"}, default="ms"
+    )
+
+    # Snap sample timestamps to the start of their data fetch interval, so
+    # every device reports on the same time grid
+    KASA_COLLECTOR_ALIGN_TIMESTAMPS = _get_bool_config(
+        "KASA_COLLECTOR_ALIGN_TIMESTAMPS", default=False
+    )
+
+    # Query only the realtime energy module between full device refreshes.
+    # A full update() still runs on every sysinfo cycle.
+    KASA_COLLECTOR_EMETER_FAST_PATH = _get_bool_config(
+        "KASA_COLLECTOR_EMETER_FAST_PATH", default=True
+    )
+
+    # Read legacy IOT plugs and strips with combined sysinfo/emeter requests
+    # instead of update() or the energy module. Without it an IOT strip
+    # costs one request per outlet on every poll
+    KASA_COLLECTOR_IOT_COMBINED_QUERY = _get_bool_config(
+        "KASA_COLLECTOR_IOT_COMBINED_QUERY", default=False
+    )
+
     # Device management
     KASA_COLLECTOR_KEEP_MISSING_DEVICES = _get_bool_config(
         "KASA_COLLECTOR_KEEP_MISSING_DEVICES", default=True
     )
 
+    # Where collected samples go, comma-separated: influxdb, prometheus
+    # (served from memory at the metrics endpoint), file and/or parquet
+    KASA_COLLECTOR_SINKS = _get_list_config(
+        "KASA_COLLECTOR_SINKS",
+        {"influxdb", "prometheus", "file", "parquet"},
+        default="influxdb",
+    )
+    # KASA_COLLECTOR_WRITE_TO_FILE predates the sink list and adds the file sink
+    if KASA_COLLECTOR_WRITE_TO_FILE and "file" not in KASA_COLLECTOR_SINKS:
+        KASA_COLLECTOR_SINKS.append("file")
+
     # URL for the InfluxDB instance.
     KASA_COLLECTOR_INFLUXDB_URL = os.getenv("KASA_COLLECTOR_INFLUXDB_URL")
 
@@ -114,6 +323,60 @@ class Config:
         "KASA_COLLECTOR_INFLUXDB_FLUSH_INTERVAL", default=10, min_value=1
     )
 
+    # Bounded queue between device polling and storage
+    KASA_COLLECTOR_QUEUE_MAX_SIZE = _get_int_config(
+        "KASA_COLLECTOR_QUEUE_MAX_SIZE", default=10000, min_value=1
+    )
+
+    # What to do when the queue is full: block, drop_oldest or spill (to disk)
+    KASA_COLLECTOR_QUEUE_OVERFLOW_POLICY = _get_choice_config(
+        "KASA_COLLECTOR_QUEUE_OVERFLOW_POLICY",
+        {"block", "drop_oldest", "spill"},
+        default="drop_oldest",
+    )
+
+    # Directory for data waiting to be written (queue overflow, InfluxDB spool)
+    KASA_COLLECTOR_SPOOL_DIR = os.getenv("KASA_COLLECTOR_SPOOL_DIR", "spool")
+
+    # Spool points to disk while InfluxDB is unreachable and replay them later
+    KASA_COLLECTOR_SPOOL_ENABLED = _get_bool_config(
+        "KASA_COLLECTOR_SPOOL_ENABLED", default=True
+    )
+
+    KASA_COLLECTOR_SPOOL_SEGMENT_SIZE_MB = _get_int_config(
+        "KASA_COLLECTOR_SPOOL_SEGMENT_SIZE_MB", default=16, min_value=1
+    )
+
+    KASA_COLLECTOR_SPOOL_MAX_SIZE_MB = _get_int_config(
+        "KASA_COLLECTOR_SPOOL_MAX_SIZE_MB", default=1024, min_value=1
+    )
+
+    # Spooled data older than this (seconds) is discarded. Default is 7 days.
+    KASA_COLLECTOR_SPOOL_MAX_AGE = _get_int_config(
+        "KASA_COLLECTOR_SPOOL_MAX_AGE", default=604800, min_value=1
+    )
+
+    KASA_COLLECTOR_SPOOL_REPLAY_BATCH_SIZE = _get_int_config(
+        "KASA_COLLECTOR_SPOOL_REPLAY_BATCH_SIZE", default=5000, min_value=1
+    )
+
+    # Maximum points per second written to InfluxDB while replaying the spool
+    KASA_COLLECTOR_SPOOL_REPLAY_RATE = _get_int_config(
+        "KASA_COLLECTOR_SPOOL_REPLAY_RATE", default=10000, min_value=1
+    )
+
+    # Local HTTP endpoint serving self-monitoring metrics at /metrics. Off
+    # unless asked for; the prometheus sink turns it on by itself.
+    KASA_COLLECTOR_METRICS_ENABLED = _get_bool_config(
+        "KASA_COLLECTOR_METRICS_ENABLED", default=False
+    )
+
+    KASA_COLLECTOR_METRICS_HOST = os.getenv("KASA_COLLECTOR_METRICS_HOST", "0.0.0.0")
+
+    KASA_COLLECTOR_METRICS_PORT = _get_int_config(
+        "KASA_COLLECTOR_METRICS_PORT", default=9561, min_value=1
+    )
+
     # Logging configuration
     KASA_COLLECTOR_LOG_LEVEL_KASA_API = _get_log_level(
         "KASA_COLLECTOR_LOG_LEVEL_KASA_API", default="INFO"
@@ -127,6 +390,28 @@ class Config:
         "KASA_COLLECTOR_LOG_LEVEL_KASA_COLLECTOR", default="INFO"
     )
 
+    # Log output format: text or json (one JSON object per line)
+    KASA_COLLECTOR_LOG_FORMAT = _get_choice_config(
+        "KASA_COLLECTOR_LOG_FORMAT", {"text", "json"}, default="text"
+    )
+
+    # Identical warnings and errors are logged at most once per this many
+    # seconds; 0 logs every occurrence
+    KASA_COLLECTOR_LOG_RATE_LIMIT_INTERVAL = _get_int_config(
+        "KASA_COLLECTOR_LOG_RATE_LIMIT_INTERVAL", default=300, min_value=0
+    )
+
+    # Reconnect devices from the saved inventory on startup and run discovery
+    # in the background instead of before the first poll
+    KASA_COLLECTOR_WARM_START = _get_bool_config(
+        "KASA_COLLECTOR_WARM_START", default=True
+    )
+
+    # File holding the connection parameters of known devices
+    KASA_COLLECTOR_INVENTORY_FILE = os.getenv(
+        "KASA_COLLECTOR_INVENTORY_FILE", "state/device_inventory.json"
+    )
+
     # Comma-separated list of device hosts (IPs) for manual configuration.
     KASA_COLLECTOR_DEVICE_HOSTS = os.getenv("KASA_COLLECTOR_DEVICE_HOSTS", None)
 
@@ -156,10 +441,15 @@ class Config:
         "KASA_COLLECTOR_SHUTDOWN_TIMEOUT", default=10, min_value=1
     )
 
+    # 0 disables caching: names are looked up again on every use
     KASA_COLLECTOR_DNS_CACHE_TTL = _get_int_config(
         "KASA_COLLECTOR_DNS_CACHE_TTL", default=300, min_value=0
     )
 
+    KASA_COLLECTOR_DNS_LOOKUP_TIMEOUT = _get_int_config(
+        "KASA_COLLECTOR_DNS_LOOKUP_TIMEOUT", default=2, min_value=1
+    )
+
     KASA_COLLECTOR_MAX_RETRY_DELAY = _get_int_config(
         "KASA_COLLECTOR_MAX_RETRY_DELAY", default=60, min_value=1
     )
@@ -0,0 +1,99 @@
+"""
+Per-device connection profile cache.
+Remembers which connection strategy last worked for each device, and the
+resulting connection parameters, so reconnects try that first instead of
+walking the full fallback ladder.
+"""
+
+import logging
+from typing import Optional
+
+type ProfileStats = dict[str, int]
+
+logger = logging.getLogger(__name__)
+
+# Connection strategies, in the order the fallback ladder tries them
+STRATEGY_DISCOVER_SINGLE = "discover_single"
+STRATEGY_CONNECT_CREDENTIALS = "connect_credentials"
+STRATEGY_CONNECT = "connect"
+# Devices found by broadcast discovery or restored from the inventory
+STRATEGY_DISCOVERY = "discovery"
+STRATEGY_INVENTORY = "inventory"
+
+
+class ConnectionProfile:
+    """
+    The strategy that last connected a device and the DeviceConfig it produced.
+    """
+
+    __slots__ = ("strategy", "config")
+
+    def __init__(self, strategy: str, config):
+        self.strategy = strategy
+        self.config = config
+
+
+class ConnectionProfileCache:
+    """
+    In-memory map of device key to its last working ConnectionProfile.
+
+    A hit is a reconnect that succeeded with the cached profile; a miss is a
+    reconnect whose profile failed and had to fall back to the full ladder.
+    Devices contacted with nothing saved for them are counted separately as
+    first contacts, so they don't drag the hit rate down.
+    """
+
+    def __init__(self):
+        self._profiles: dict[str, ConnectionProfile] = {}
+        self.hits = 0
+        self.misses = 0
+        self.first_contacts = 0
+
+    def get(self, key: str) -> Optional[ConnectionProfile]:
+        """Return the cached profile for a device, if any."""
+        return self._profiles.get(key)
+
+    def record(self, key: str, strategy: str, config):
+        """Remember the strategy and config that just connected a device."""
+        self._profiles[key] = ConnectionProfile(strategy, config)
+        logger.debug(f"Cached connection profile for {key}: {strategy}")
+
+    def invalidate(self, key: str):
+        """Forget a profile that no longer works."""
+        self._profiles.pop(key, None)
+
+    def record_hit(self):
+        self.hits += 1
+
+    def record_miss(self):
+        self.misses += 1
+
+    def record_first_contact(self):
+        self.first_contacts += 1
+
+    def stats(self) -> ProfileStats:
+        """
+        Get cache statistics for export as self-monitoring metrics.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "profiles": len(self._profiles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "first_contacts": self.first_contacts,
+            "hit_rate_percent": round(self.hits * 100 / lookups) if lookups else 0,
+        }
+
+
+# Global connection profile cache instance
+_connection_profiles: Optional[ConnectionProfileCache] = None
+
+
+def get_connection_profiles() -> ConnectionProfileCache:
+    """
+    Get the global connection profile cache instance.
+    """
+    global _connection_profiles
+    if _connection_profiles is None:
+        _connection_profiles = ConnectionProfileCache()
+    return _connection_profiles
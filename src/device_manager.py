@@ -4,6 +4,14 @@ from config import Config
 from datetime import datetime, timedelta
 from dns_cache import get_hostname_cached
 from utils import get_device_name
+from metrics import get_metrics
+from inventory import DeviceInventory
+from subnet_discovery import SubnetScanner
+from connection_profiles import (
+    get_connection_profiles,
+    STRATEGY_DISCOVERY,
+    STRATEGY_INVENTORY,
+)
 
 
 class DeviceManager:
@@ -32,23 +40,81 @@ class DeviceManager:
         self.max_retries = Config.KASA_COLLECTOR_AUTH_MAX_RETRIES
         self.timeout_seconds = Config.KASA_COLLECTOR_AUTH_TIMEOUT
 
+        # Connection parameters of known devices, for warm starts
+        self.inventory = DeviceInventory()
+
+        # Unicast discovery of configured subnets replaces the broadcast
+        self.subnet_scanner = None
+        if Config.KASA_COLLECTOR_DISCOVERY_SUBNETS:
+            self.subnet_scanner = SubnetScanner(probe=KasaAPI.probe_host)
+            get_metrics().register_source(
+                "subnet_discovery", self.subnet_scanner.stats
+            )
+
+    async def restore_inventory(self):
+        """
+        Reconnect devices from the saved inventory, in parallel, without
+        discovery or authentication fallbacks. Devices that fail are left to
+        manual initialization and discovery. Returns the number restored.
+        """
+        entries = dict(self.inventory.entries)
+        if not entries:
+            return 0
+
+        self.logger.info(f"Reconnecting {len(entries)} devices from inventory...")
+        start_time = datetime.now()
+
+        async def restore_device(ip, entry):
+            """Reconnect a single device from its inventory entry."""
+            try:
+                config = DeviceInventory.device_config(
+                    entry, self.tplink_username, self.tplink_password
+                )
+                device = await asyncio.wait_for(
+                    KasaAPI.connect_with_config(config),
+                    timeout=self.timeout_seconds,
+                )
+                get_connection_profiles().record(
+                    ip, entry.get("strategy", STRATEGY_INVENTORY), device.config
+                )
+                await self._register_device(ip, device)
+            except Exception as e:
+                self.logger.warning(f"Could not reconnect {ip} from inventory: {e}")
+
+        async with asyncio.TaskGroup() as tg:
+            for ip, entry in entries.items():
+                tg.create_task(restore_device(ip, entry))
+
+        restored = sum(1 for ip in entries if ip in self.devices)
+        elapsed_time = (datetime.now() - start_time).total_seconds()
+        self.logger.info(
+            f"Reconnected {restored}/{len(entries)} devices from inventory "
+            f"in {elapsed_time:.2f} seconds."
+        )
+        await self.inventory.save()
+        return restored
+
     async def initialize_manual_devices(self):
         """
         Initialize manual devices based on IPs or hostnames in the config.
         Fetch and authenticate devices manually specified in the config.
         """
-        if not self.device_hosts:
+        hosts = [ip for ip in self.device_hosts if ip not in self.devices]
+        if not hosts:
             return
             
         async def add_manual_device(ip):
             """Add a single manual device."""
             try:
-                device = await KasaAPI.get_device(
-                    ip, self.tplink_username, self.tplink_password
-                )
-                self.devices[ip] = device
-                # Check and store devices based on emeter capabilities
-                self._check_and_add_emeter_device(ip, device)
+                device = await self._connect_known_device(ip)
+                if device is None:
+                    device = await KasaAPI.get_device(
+                        ip,
+                        self.tplink_username,
+                        self.tplink_password,
+                        preferred_strategy=self._saved_strategy(ip),
+                    )
+                await self._register_device(ip, device)
                 device_name = get_device_name(device)
                 hostname = await get_hostname_cached(ip)
                 # Always show manually added devices at INFO level
@@ -60,9 +126,11 @@ class DeviceManager:
         
         # Process all manual devices in parallel
         async with asyncio.TaskGroup() as tg:
-            for ip in self.device_hosts:
+            for ip in hosts:
                 tg.create_task(add_manual_device(ip))
 
+        await self.inventory.save()
+
     async def discover_devices(self):
         """
         Discover Kasa devices on the network and authenticate them.
@@ -82,12 +150,22 @@ class DeviceManager:
         start_time = datetime.now()
 
         # Discover devices
-        discovered_devices = await KasaAPI.discover_devices()
-        num_discovered = len(discovered_devices)
-        if num_discovered > 0:
-            self.logger.info(f"Discovered {num_discovered} devices.")
+        if self.subnet_scanner:
+            # Only part of the subnets is probed per cycle, so finding
+            # nothing new is expected
+            discovered_devices = await self.subnet_scanner.scan(known=self.devices)
+            if discovered_devices:
+                self.logger.info(
+                    f"Discovered {len(discovered_devices)} devices in configured "
+                    f"subnets."
+                )
         else:
-            self.logger.warning("No devices discovered on the network.")
+            discovered_devices = await KasaAPI.discover_devices()
+            num_discovered = len(discovered_devices)
+            if num_discovered > 0:
+                self.logger.info(f"Discovered {num_discovered} devices.")
+            else:
+                self.logger.warning("No devices discovered on the network.")
 
         # List to hold async tasks for parallel execution
         auth_tasks = []
@@ -114,6 +192,7 @@ class DeviceManager:
         # Track the time taken for discovery and authentication
         end_time = datetime.now()
         elapsed_time = (end_time - start_time).total_seconds()
+        get_metrics().observe("discovery_seconds", elapsed_time)
 
         # Show completion at INFO level for first discovery
         if not self.first_discovery_complete:
@@ -136,6 +215,8 @@ class DeviceManager:
         ).strftime("%Y-%m-%d %H:%M:%S")
         self.logger.debug(f"Next device discovery will run at {next_discovery_time}.")
 
+        await self.inventory.save()
+
         # Mark first discovery as complete
         self.first_discovery_complete = True
 
@@ -143,15 +224,29 @@ class DeviceManager:
         """
         Authenticate the device with retries and timeout. If authentication succeeds,
         add the device to the managed devices list.
+        A device that connected before is reconnected straight from its saved
+        connection profile, skipping the retry and fallback ladder.
+        Each connection attempt holds a slot of the shared request semaphore
+        only while it talks to the device, not across retries or lookups.
         """
+        known_device = await self._connect_known_device(ip)
+        if known_device is not None:
+            await self._register_device(ip, known_device)
+            self.logger.debug(
+                f"Reconnected device: {get_device_name(known_device)} (IP: {ip})"
+            )
+            return
+
         # First try to use the discovered device directly
         if discovered_device:
             success = await KasaAPI.authenticate_discovered_device(
                 discovered_device, self.tplink_username, self.tplink_password
             )
             if success:
-                self.devices[ip] = discovered_device
-                self._check_and_add_emeter_device(ip, discovered_device)
+                get_connection_profiles().record(
+                    ip, STRATEGY_DISCOVERY, discovered_device.config
+                )
+                await self._register_device(ip, discovered_device)
                 device_name = get_device_name(discovered_device)
                 hostname = await get_hostname_cached(ip)
                 # Show details on first run at INFO level
@@ -180,13 +275,17 @@ class DeviceManager:
             try:
                 # Add timeout for authentication process
                 authenticated_device = await asyncio.wait_for(
-                    KasaAPI.get_device(ip, self.tplink_username, self.tplink_password),
+                    KasaAPI.get_device(
+                        ip,
+                        self.tplink_username,
+                        self.tplink_password,
+                        preferred_strategy=self._saved_strategy(ip),
+                    ),
                     timeout=self.timeout_seconds,
                 )
 
                 # If authentication is successful, store the device
-                self.devices[ip] = authenticated_device
-                self._check_and_add_emeter_device(ip, authenticated_device)
+                await self._register_device(ip, authenticated_device)
                 device_name = get_device_name(authenticated_device)
                 hostname = await get_hostname_cached(ip)
                 # Show details on first run at INFO level
@@ -235,8 +334,7 @@ class DeviceManager:
         try:
             # Try to connect without credentials as some devices may not require them
             unauthenticated_device = await KasaAPI.get_device(ip)
-            self.devices[ip] = unauthenticated_device
-            self._check_and_add_emeter_device(ip, unauthenticated_device)
+            await self._register_device(ip, unauthenticated_device)
             device_name = get_device_name(unauthenticated_device)
             hostname = await get_hostname_cached(ip)
             # Show details on first run at INFO level
@@ -274,6 +372,7 @@ class DeviceManager:
             for ip in list(self.devices.keys()):
                 if ip not in discovered_devices:
                     missing_device = self.devices.pop(ip)
+                    self.inventory.forget(ip)
                     device_name = get_device_name(missing_device)
                     self.emeter_devices.pop(
                         ip, None
@@ -286,6 +385,61 @@ class DeviceManager:
                         f"Device missing: {device_name} (IP: {ip}, Host: {hostname})"
                     )
 
+    def _saved_strategy(self, ip):
+        """Return the connection strategy saved in the inventory for ip."""
+        return self.inventory.entries.get(ip, {}).get("strategy")
+
+    async def _connect_known_device(self, ip):
+        """
+        Reconnect a device that connected before, from its cached connection
+        profile or, after a restart, its inventory entry. Returns the device,
+        or None when nothing is saved for it or the saved parameters no longer
+        work. Counts as a profile cache hit or miss when something was saved,
+        and as a first contact otherwise.
+        """
+        profiles = get_connection_profiles()
+        profile = profiles.get(ip)
+        entry = self.inventory.entries.get(ip)
+        try:
+            if profile is not None:
+                config, strategy = profile.config, profile.strategy
+            elif entry is not None:
+                config = DeviceInventory.device_config(
+                    entry, self.tplink_username, self.tplink_password
+                )
+                strategy = entry.get("strategy") or STRATEGY_INVENTORY
+            else:
+                profiles.record_first_contact()
+                return None
+            device = await asyncio.wait_for(
+                KasaAPI.connect_with_config(config), timeout=self.timeout_seconds
+            )
+        except Exception as e:
+            self.logger.debug(f"Saved connection profile failed for {ip}: {e}")
+            # Drop both copies so the next attempt goes straight to the ladder;
+            # whatever connects the device next is saved again
+            profiles.invalidate(ip)
+            self.inventory.forget(ip)
+            profiles.record_miss()
+            return None
+
+        profiles.record_hit()
+        profiles.record(ip, strategy, device.config)
+        return device
+
+    async def _register_device(self, ip, device):
+        """
+        Add a connected device to the managed devices and the inventory.
+        """
+        # Resolve the hostname before the device is polled, so its first
+        # samples aren't tagged with the bare IP; polls only ever read it
+        # from the cache, which refreshes it in the background from then on
+        await get_hostname_cached(ip)
+        self.devices[ip] = device
+        self._check_and_add_emeter_device(ip, device)
+        profile = get_connection_profiles().get(ip)
+        self.inventory.record(ip, device, profile.strategy if profile else None)
+
     def _check_and_add_emeter_device(self, ip, device):
         """
         Check if device has emeter capabilities and add to emeter_devices.
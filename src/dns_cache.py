@@ -1,98 +1,260 @@
 import time
 import socket
 import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional
 import logging
 from config import Config
 
-type CacheEntry = tuple[str, float]  # (hostname, timestamp)
 type CacheStats = dict[str, int | float]
 
 logger = logging.getLogger(__name__)
 
+# Failed lookups are retried after this many seconds (or the TTL, if shorter)
+NEGATIVE_TTL = 60
+
+# Resolver threads, kept apart from the default executor so a slow DNS server
+# can't hold up file writes and other to_thread work
+LOOKUP_WORKERS = 4
+
+# Shortest time between pruning passes
+MIN_PRUNE_INTERVAL = 60
+
+
+class _CacheEntry:
+    """A resolved (or failed) hostname and when it goes stale."""
+
+    __slots__ = ("hostname", "expires_at", "last_used")
+
+    def __init__(self, hostname: str, expires_at: float, last_used: float):
+        self.hostname = hostname
+        self.expires_at = expires_at
+        self.last_used = last_used
+
 
 class DNSCache:
     """
     DNS cache implementation with TTL support for hostname resolution.
     Prevents repeated DNS lookups for the same IP addresses.
+
+    Concurrent lookups of the same IP share one in-flight resolution. Once an
+    entry is stale the old hostname keeps being returned while it is refreshed
+    in the background, so only the very first lookup of an IP waits on the
+    resolver, and never for longer than the lookup timeout.
+
+    A TTL of 0 disables caching: every get_hostname() waits for a fresh
+    lookup, shared with any lookup of the same IP already in flight, and
+    get_hostname_nowait() returns the latest result while starting the next.
+
+    Lookups run in a small thread pool. A timed-out lookup keeps its thread
+    until the resolver gives up, so once every thread is stuck new lookups
+    fail straight away instead of queueing behind them.
     """
 
-    def __init__(self, ttl_seconds: Optional[int] = None):  # Use config default TTL
+    def __init__(
+        self,
+        ttl_seconds: Optional[int] = None,
+        lookup_timeout: Optional[float] = None,
+    ):  # Use config defaults
         if ttl_seconds is None:
             ttl_seconds = Config.KASA_COLLECTOR_DNS_CACHE_TTL
-        self.cache: Dict[str, CacheEntry] = {}
+        if lookup_timeout is None:
+            lookup_timeout = Config.KASA_COLLECTOR_DNS_LOOKUP_TIMEOUT
+        self.cache: Dict[str, _CacheEntry] = {}
         self.ttl_seconds = ttl_seconds
-        self._lock = asyncio.Lock()
+        self.lookup_timeout = lookup_timeout
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=LOOKUP_WORKERS, thread_name_prefix="dns"
+        )
+        # Resolver threads busy with a lookup, including timed-out ones
+        self._busy_workers = 0
+        self._busy_lock = threading.Lock()
+        self._saturated = False
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lookups = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.saturated = 0
 
     async def get_hostname(self, ip: str) -> str:
         """
         Get hostname for IP address with caching.
-        Returns cached value if available and not expired, otherwise performs lookup.
+        Returns the cached value if there is one, refreshing it in the background
+        once it is stale. Otherwise waits for a lookup, falling back to the IP.
         """
-        current_time = time.time()
-
-        async with self._lock:
-            # Check cache first
-            if ip in self.cache:
-                hostname, timestamp = self.cache[ip]
-                if current_time - timestamp < self.ttl_seconds:
-                    logger.debug(f"DNS cache hit for {ip}: {hostname}")
-                    return hostname
-                else:
-                    # Expired entry, remove it
-                    del self.cache[ip]
-                    logger.debug(f"DNS cache expired for {ip}")
-
-        # Cache miss or expired, perform lookup
+        now = time.monotonic()
+        entry = self.cache.get(ip)
+        if entry is not None:
+            entry.last_used = now
+            if now < entry.expires_at:
+                self.hits += 1
+                return entry.hostname
+            if self.ttl_seconds > 0:
+                self.stale_hits += 1
+                self._lookup(ip)
+                return entry.hostname
+
+        self.misses += 1
         try:
-            loop = asyncio.get_running_loop()
-            hostname = await loop.run_in_executor(None, socket.getfqdn, ip)
+            return await asyncio.shield(self._lookup(ip))
+        except Exception:
+            return entry.hostname if entry is not None else ip
 
-            async with self._lock:
-                self.cache[ip] = (hostname, current_time)
-                logger.debug(f"DNS cache stored for {ip}: {hostname}")
+    def get_hostname_nowait(self, ip: str) -> str:
+        """
+        Return the cached hostname for ip without waiting, or the IP itself if
+        it hasn't been resolved yet. Starts a lookup when the entry is missing
+        or stale, so the name is in place for the next call.
+        """
+        now = time.monotonic()
+        entry = self.cache.get(ip)
+        if entry is None:
+            self.misses += 1
+            self._lookup(ip)
+            return ip
+        entry.last_used = now
+        if now < entry.expires_at:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+            self._lookup(ip)
+        return entry.hostname
 
-            return hostname
+    def _lookup(self, ip: str) -> asyncio.Task:
+        """Return the in-flight lookup for ip, starting one if there is none."""
+        task = self._inflight.get(ip)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = asyncio.create_task(self._resolve(ip))
+        self._inflight[ip] = task
+        task.add_done_callback(lambda _: self._inflight.pop(ip, None))
+        return task
 
+    async def _resolve(self, ip: str) -> str:
+        """Reverse-resolve ip with a timeout and store the result."""
+        self.lookups += 1
+        loop = asyncio.get_running_loop()
+        try:
+            if self._busy_workers >= LOOKUP_WORKERS:
+                self._on_saturated(ip)
+                hostname = None
+            else:
+                self._saturated = False
+                hostname = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, self._getfqdn, ip),
+                    timeout=self.lookup_timeout,
+                )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.debug(
+                f"DNS lookup for {ip} timed out after {self.lookup_timeout}s"
+            )
+            hostname = None
         except Exception as e:
             logger.warning(f"DNS lookup failed for {ip}: {e}")
-            return ip  # Return IP as fallback
+            hostname = None
+
+        # getfqdn hands back the address itself when there is no name
+        if hostname is None or hostname == ip:
+            self.failures += 1
+            # Keep serving a previously resolved name; retry sooner than the TTL
+            entry = self.cache.get(ip)
+            hostname = entry.hostname if entry is not None else ip
+            self._store(ip, hostname, min(self.ttl_seconds, NEGATIVE_TTL))
+            return hostname
+
+        self._store(ip, hostname, self.ttl_seconds)
+        logger.debug(f"DNS cache stored for {ip}: {hostname}")
+        return hostname
+
+    def _getfqdn(self, ip: str) -> str:
+        """Run socket.getfqdn in a resolver thread, counting busy threads."""
+        with self._busy_lock:
+            self._busy_workers += 1
+        try:
+            return socket.getfqdn(ip)
+        finally:
+            with self._busy_lock:
+                self._busy_workers -= 1
+
+    def _on_saturated(self, ip: str):
+        """Record a lookup skipped because every resolver thread is stuck."""
+        self.saturated += 1
+        if not self._saturated:
+            self._saturated = True
+            logger.warning(
+                f"All {LOOKUP_WORKERS} DNS resolver threads are stuck on "
+                f"lookups that timed out; skipping lookups (first: {ip}) "
+                f"until one returns"
+            )
+
+    def _store(self, ip: str, hostname: str, ttl: float):
+        now = time.monotonic()
+        entry = self.cache.get(ip)
+        last_used = entry.last_used if entry is not None else now
+        self.cache[ip] = _CacheEntry(hostname, now + ttl, last_used)
 
     async def clear_expired(self):
         """
-        Remove expired entries from cache.
+        Remove entries that have gone stale without being asked for since.
+        Entries still in use are refreshed rather than dropped.
         """
-        current_time = time.time()
-        expired_keys = []
-
-        async with self._lock:
-            for ip, (hostname, timestamp) in self.cache.items():
-                if current_time - timestamp >= self.ttl_seconds:
-                    expired_keys.append(ip)
-
-            for key in expired_keys:
-                del self.cache[key]
+        current_time = time.monotonic()
+        expired_keys = [
+            ip
+            for ip, entry in self.cache.items()
+            if entry.last_used < entry.expires_at <= current_time
+        ]
+        for key in expired_keys:
+            del self.cache[key]
 
         if expired_keys:
             logger.debug(f"Cleared {len(expired_keys)} expired DNS cache entries")
 
+    async def run_pruning(self):
+        """Prune the cache on a schedule. Runs until cancelled."""
+        interval = max(self.ttl_seconds, MIN_PRUNE_INTERVAL)
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await self.clear_expired()
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
     def get_cache_stats(self) -> CacheStats:
         """
         Get cache statistics using modern type annotations.
         """
-        current_time = time.time()
+        current_time = time.monotonic()
         expired_count = sum(
-            1
-            for _, timestamp in self.cache.values()
-            if current_time - timestamp >= self.ttl_seconds
+            1 for entry in self.cache.values() if current_time >= entry.expires_at
         )
 
+        requests = self.hits + self.stale_hits + self.misses
         return {
             "total_entries": len(self.cache),
             "expired_entries": expired_count,
             "active_entries": len(self.cache) - expired_count,
             "ttl_seconds": self.ttl_seconds,
-            "cache_hit_rate": getattr(self, "_hit_rate", 0.0),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "lookups": self.lookups,
+            "lookups_in_flight": len(self._inflight),
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "busy_workers": self._busy_workers,
+            "saturated": self.saturated,
+            "cache_hit_rate": (
+                (self.hits + self.stale_hits) / requests if requests else 0.0
+            ),
         }
 
 
@@ -116,3 +278,10 @@ async def get_hostname_cached(ip: str) -> str:
     """
     cache = get_dns_cache()
     return await cache.get_hostname(ip)
+
+
+def get_hostname_nowait(ip: str) -> str:
+    """
+    Convenience function to read a cached hostname without waiting.
+    """
+    return get_dns_cache().get_hostname_nowait(ip)
@@ -0,0 +1,279 @@
+"""
+File sink that streams collected samples to per-device JSON Lines files.
+Files stay open between writes, are rotated by size or age, and rotated
+segments are compressed.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from config import Config
+from sinks import Sink, Sample
+from utils import datetime_from_ns, sample_timestamp
+
+try:
+    import zstandard
+except ImportError:  # Only needed for KASA_COLLECTOR_FILE_COMPRESSION=zstd
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Samples written per batch and the longest a sample waits to be written
+FILE_BATCH_SIZE = 500
+FILE_FLUSH_INTERVAL = 5
+
+ACTIVE_SUFFIX = ".jsonl"
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+
+class _OpenFile:
+    """An open, buffered output file."""
+
+    __slots__ = ("path", "handle", "size", "opened_at")
+
+    def __init__(self, path: str, opened_at: Optional[float] = None):
+        self.path = path
+        self.handle = open(path, "a", encoding="utf-8")
+        self.size = self.handle.tell()
+        # Age counts from the file's first record, so reopening a file after
+        # it was evicted or the collector restarted doesn't postpone rotation.
+        # A file evicted earlier passes in its known age instead of rereading.
+        if not self.size:
+            self.opened_at = time.time()
+        elif opened_at is not None:
+            self.opened_at = opened_at
+        else:
+            self.opened_at = _first_record_time(path) or os.path.getmtime(path)
+
+
+def _first_record_time(path: str) -> Optional[float]:
+    """Return the time stamped on the first record of a file, if readable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            record = json.loads(f.readline())
+        (device_data,) = record.values()
+        return datetime.fromisoformat(device_data["time"]).timestamp()
+    except Exception:
+        return None
+
+
+class FileSink(Sink):
+    """
+    Appends each sample as one compact JSON line to emeter_<device>.jsonl or
+    sysinfo_<device>.jsonl in the output directory.
+
+    Files are opened once and every batch is written and flushed in a single
+    worker-thread call. A file that reaches the rotation size or age is
+    renamed to <name>.<timestamp>.jsonl and compressed in the background.
+    """
+
+    name = "file"
+
+    def __init__(
+        self,
+        output_dir: Optional[str] = None,
+        rotate_size: Optional[int] = None,
+        rotate_interval: Optional[int] = None,
+        compression: Optional[str] = None,
+        max_open_files: Optional[int] = None,
+    ):
+        super().__init__(
+            batch_size=FILE_BATCH_SIZE, flush_interval=FILE_FLUSH_INTERVAL
+        )
+        if output_dir is None:
+            output_dir = Config.KASA_COLLECTOR_OUTPUT_DIR
+        if rotate_size is None:
+            rotate_size = Config.KASA_COLLECTOR_FILE_ROTATE_SIZE_MB * 1024 * 1024
+        if rotate_interval is None:
+            rotate_interval = Config.KASA_COLLECTOR_FILE_ROTATE_INTERVAL
+        if compression is None:
+            compression = Config.KASA_COLLECTOR_FILE_COMPRESSION
+        if max_open_files is None:
+            max_open_files = Config.KASA_COLLECTOR_FILE_MAX_OPEN_FILES
+        if compression == "zstd" and zstandard is None:
+            logger.error(
+                "zstd compression requires the zstandard package "
+                "(pip install zstandard), using gzip"
+            )
+            compression = "gzip"
+
+        self.output_dir = output_dir
+        self.rotate_size = rotate_size
+        self.rotate_interval = rotate_interval
+        self.compression = compression
+        self.max_open_files = max_open_files
+        self._files: OrderedDict[str, _OpenFile] = OrderedDict()
+        # Age of active files closed to make room, kept so reopening them
+        # doesn't have to read their first record again
+        self._evicted_opened_at: dict[str, float] = {}
+        self._compressions: set[asyncio.Task] = set()
+        # Held by the worker thread while it touches the open files; a write
+        # can still be running in a thread after its task was cancelled
+        self._io_lock = threading.Lock()
+        self.rotations = 0
+
+    async def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def _path_for(self, ip: str, device_data: dict) -> str:
+        """Return the active file for a device's emeter or sysinfo samples."""
+        alias = device_data.get("alias") or device_data.get("device_alias") or ip
+        dns_name = device_data.get("dns_name", "")
+        identifier = alias or dns_name or ip
+        sanitized_identifier = "".join(
+            c if c.isalnum() or c in "-_." else "_" for c in identifier
+        )
+        file_type = "emeter" if "emeter" in device_data else "sysinfo"
+        return os.path.join(
+            self.output_dir, f"{file_type}_{sanitized_identifier}{ACTIVE_SUFFIX}"
+        )
+
+    async def write(self, samples: list[Sample]):
+        # Serialize on the event loop, then do all file I/O in one thread call.
+        # Records are stamped so the backfill tool can replay them in place.
+        lines: dict[str, list[str]] = {}
+        for sample in samples:
+            stamp = datetime_from_ns(
+                sample.get("time") or sample_timestamp()
+            ).isoformat()
+            for ip, device_data in sample["data"].items():
+                lines.setdefault(self._path_for(ip, device_data), []).append(
+                    json.dumps(
+                        {ip: {**device_data, "time": stamp}},
+                        separators=(",", ":"),
+                        default=str,
+                    )
+                )
+        rotated = await asyncio.to_thread(self._write_lines, lines)
+        self._compress_in_background(rotated)
+
+    async def periodic(self):
+        # Rotate files that reached their age without another write
+        if any(
+            time.time() - f.opened_at >= self.rotate_interval
+            for f in self._files.values()
+        ):
+            rotated = await asyncio.to_thread(self._rotate_aged)
+            self._compress_in_background(rotated)
+
+    def _write_lines(self, lines: dict[str, list[str]]) -> list[str]:
+        """
+        Append lines to their files and flush. Runs in a worker thread and
+        returns the segments rotated out by this batch.
+        """
+        rotated = []
+        with self._io_lock:
+            for path, records in lines.items():
+                try:
+                    open_file = self._open(path)
+                    data = "\n".join(records) + "\n"
+                    open_file.handle.write(data)
+                    open_file.handle.flush()
+                    open_file.size += len(data.encode("utf-8"))
+                    if open_file.size >= self.rotate_size:
+                        rotated.append(self._rotate(open_file))
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Error writing data to file {path}: {e}")
+        return rotated
+
+    def _rotate_aged(self) -> list[str]:
+        now = time.time()
+        rotated = []
+        with self._io_lock:
+            for open_file in list(self._files.values()):
+                if now - open_file.opened_at >= self.rotate_interval:
+                    try:
+                        rotated.append(self._rotate(open_file))
+                    except Exception as e:
+                        self.errors += 1
+                        logger.error(f"Error rotating file {open_file.path}: {e}")
+        return rotated
+
+    def _close_files(self):
+        """Close every open file once no write is in progress."""
+        with self._io_lock:
+            for open_file in self._files.values():
+                open_file.handle.close()
+            self._files.clear()
+
+    def _open(self, path: str) -> _OpenFile:
+        """Return the open file for path, opening it if needed."""
+        open_file = self._files.get(path)
+        if open_file is not None:
+            self._files.move_to_end(path)
+            return open_file
+
+        if len(self._files) >= self.max_open_files:
+            _, least_recent = self._files.popitem(last=False)
+            least_recent.handle.close()
+            self._evicted_opened_at[least_recent.path] = least_recent.opened_at
+        open_file = self._files[path] = _OpenFile(
+            path, self._evicted_opened_at.pop(path, None)
+        )
+        return open_file
+
+    def _rotate(self, open_file: _OpenFile) -> str:
+        """Close a file and rename it to a timestamped segment."""
+        open_file.handle.close()
+        del self._files[open_file.path]
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        base = f"{open_file.path[: -len(ACTIVE_SUFFIX)]}.{stamp}"
+        segment = f"{base}{ACTIVE_SUFFIX}"
+        sequence = 0
+        # Never overwrite a segment rotated out earlier in the same second
+        suffix = COMPRESSION_SUFFIXES[self.compression]
+        while os.path.exists(segment) or os.path.exists(segment + suffix):
+            sequence += 1
+            segment = f"{base}-{sequence}{ACTIVE_SUFFIX}"
+        os.replace(open_file.path, segment)
+        self.rotations += 1
+        logger.debug(f"Rotated {open_file.path} to {segment}")
+        return segment
+
+    def _compress_in_background(self, segments: list[str]):
+        if self.compression == "none":
+            return
+        for segment in segments:
+            task = asyncio.create_task(asyncio.to_thread(self._compress, segment))
+            self._compressions.add(task)
+            task.add_done_callback(self._compressions.discard)
+
+    def _compress(self, path: str):
+        """Compress a rotated segment and remove the original."""
+        target = path + COMPRESSION_SUFFIXES[self.compression]
+        try:
+            with open(path, "rb") as src:
+                if self.compression == "zstd":
+                    with open(target, "wb") as dst:
+                        zstandard.ZstdCompressor().copy_stream(src, dst)
+                else:
+                    with gzip.open(target, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+            os.remove(path)
+            logger.debug(f"Compressed {path} to {target}")
+        except Exception as e:
+            logger.error(f"Failed to compress {path}: {e}")
+
+    async def close(self):
+        """Write queued samples, finish compression and close every file."""
+        await super().close()
+        await asyncio.to_thread(self._close_files)
+        if self._compressions:
+            await asyncio.gather(*self._compressions, return_exceptions=True)
+
+    def stats(self):
+        stats = super().stats()
+        stats["open_files"] = len(self._files)
+        stats["evicted_files"] = len(self._evicted_opened_at)
+        stats["rotations"] = self.rotations
+        return stats
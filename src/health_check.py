@@ -31,8 +31,8 @@ def check_recent_data_files() -> tuple[bool, str]:
     if not output_path.exists():
         return False, f"Output directory {OUTPUT_DIR} does not exist"
 
-    # Find most recent emeter data file
-    emeter_files = list(output_path.glob("emeter_*.json"))
+    # Find most recent emeter data file (rotated segments are compressed)
+    emeter_files = list(output_path.glob("emeter_*.jsonl"))
 
     if not emeter_files:
         return False, "No emeter data files found"
@@ -50,11 +50,12 @@ def check_recent_data_files() -> tuple[bool, str]:
             f"(max allowed: {MAX_AGE_SECONDS}s)",
         )
 
-    # Verify file has valid JSON content
+    # Verify the last record is valid JSON
     try:
-        with open(most_recent_file, "r") as f:
-            data = json.load(f)
-            if not data:
+        with open(most_recent_file, "rb") as f:
+            f.seek(max(0, most_recent_file.stat().st_size - 65536))
+            lines = f.read().splitlines()
+            if not lines or not json.loads(lines[-1]):
                 return False, f"Data file {most_recent_file.name} is empty"
     except Exception as e:
         return False, f"Failed to read data file: {e}"
@@ -94,7 +95,11 @@ def main():
     all_healthy = True
 
     # Only check data files if writing to file is enabled
-    if os.getenv("KASA_COLLECTOR_WRITE_TO_FILE", "False").lower() == "true":
+    sinks = os.getenv("KASA_COLLECTOR_SINKS", "influxdb").lower().split(",")
+    if (
+        os.getenv("KASA_COLLECTOR_WRITE_TO_FILE", "False").lower() == "true"
+        or "file" in (sink.strip() for sink in sinks)
+    ):
         is_healthy, message = check_recent_data_files()
         checks.append(f"Data freshness: {message}")
         all_healthy &= is_healthy
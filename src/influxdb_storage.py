@@ -1,30 +1,60 @@
-import os
+import asyncio
 import logging
 import json
-import aiofiles
 
 from datetime import datetime, timezone
 from influxdb_client.client.influxdb_client import InfluxDBClient
+from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
 from influxdb_client.client.write.point import Point
-from influxdb_client.client.write_api import WriteOptions
 from influxdb_client.rest import ApiException
 from config import Config
+from logging_utils import configure_logging
+from spool import Spool
+from metrics import get_metrics
+from sinks import Sink
+from line_protocol import encode_line, series_prefix
+from utils import sample_timestamp
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+configure_logging()
 logger = logging.getLogger("InfluxDBStorage")
 logger.setLevel(Config.KASA_COLLECTOR_LOG_LEVEL_INFLUXDB_STORAGE)
 
+# Upper bound on points sent in a single write request
+MAX_POINTS_PER_WRITE = 5000
+
+# Client errors that mean "try again later" rather than "never"
+RETRYABLE_CLIENT_STATUSES = (408, 429)
+
+
+def _is_rejected(error) -> bool:
+    """
+    Return True if InfluxDB refused a write outright (bad data, auth, payload
+    too large, ...), so retrying the same batch can never succeed. Connection
+    errors, timeouts and 5xx responses are outages instead.
+    """
+    return (
+        isinstance(error, ApiException)
+        and error.status is not None
+        and 400 <= error.status < 500
+        and error.status not in RETRYABLE_CLIENT_STATUSES
+    )
+
+
+class InfluxDBStorage(Sink):
+    name = "influxdb"
 
-class InfluxDBStorage:
     def __init__(self):
         """
-        Initialize the InfluxDBStorage with InfluxDB client and write API.
+        Initialize the InfluxDBStorage and validate the InfluxDB connection.
+        The async client used for writes is created by start() once the event
+        loop is running.
         """
+        super().__init__(
+            batch_size=Config.KASA_COLLECTOR_INFLUXDB_BATCH_SIZE,
+            flush_interval=Config.KASA_COLLECTOR_INFLUXDB_FLUSH_INTERVAL,
+            max_batch=MAX_POINTS_PER_WRITE,
+        )
         self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.setLevel(Config.KASA_COLLECTOR_LOG_LEVEL_INFLUXDB_STORAGE)
 
@@ -48,16 +78,22 @@ class InfluxDBStorage:
             # Validate connection by checking health
             self._validate_connection()
 
-            self.write_api = self.client.write_api(
-                write_options=WriteOptions(
-                    batch_size=Config.KASA_COLLECTOR_INFLUXDB_BATCH_SIZE,
-                    flush_interval=Config.KASA_COLLECTOR_INFLUXDB_FLUSH_INTERVAL,
-                )
-            )
             self.bucket = Config.KASA_COLLECTOR_INFLUXDB_BUCKET
             self.sysinfo_data = (
                 {}
             )  # Store sysinfo for device mapping during emeter processing
+            # Escaped emeter series prefixes: ip -> plug_alias -> (identity, prefix)
+            self._series = {}
+
+            # Async write path, set up in start()
+            self.async_client = None
+            self.write_api = None
+            self._pending_points = []  # Points waiting for the next flush()
+            self._last_metrics = 0.0
+
+            # Points that could not be written wait on disk for replay
+            self.spool = Spool() if Config.KASA_COLLECTOR_SPOOL_ENABLED else None
+            self._sink_healthy = True
 
             self.logger.info("InfluxDB connection established successfully")
 
@@ -173,93 +209,301 @@ class InfluxDBStorage:
             self.logger.debug(f"InfluxDB connection validation failed: {e}")
             raise
 
+    async def start(self):
+        """
+        Create the async InfluxDB client used for writes.
+        The client keeps a pooled keep-alive HTTP session for all writes.
+        """
+        if self.async_client is not None:
+            return
+
+        self.async_client = InfluxDBClientAsync(
+            url=Config.KASA_COLLECTOR_INFLUXDB_URL,
+            token=Config.KASA_COLLECTOR_INFLUXDB_TOKEN,
+            org=Config.KASA_COLLECTOR_INFLUXDB_ORG,
+        )
+        self.write_api = self.async_client.write_api()
+        self.logger.debug("Started async InfluxDB client")
+
+    async def write(self, samples):
+        """
+        Build points for a batch of samples, keeping their order so sysinfo is
+        processed before the emeter samples that follow it. Points are sent
+        by the next flush().
+        """
+        metrics = get_metrics()
+        for sample in samples:
+            if sample["kind"] == "sysinfo":
+                with metrics.timer("sysinfo_point_build_seconds"):
+                    await self.process_sysinfo_data(sample["data"], sample.get("time"))
+            else:
+                with metrics.timer("emeter_point_build_seconds"):
+                    await self.process_emeter_data(sample["data"], sample.get("time"))
+
+    async def periodic(self):
+        """
+        Write the self-monitoring metrics once per data fetch interval.
+        They go out as a batch of their own and are never spooled, so a bad
+        internal point can't take device data down with it, and an outage
+        doesn't fill the spool with the collector's own metrics.
+        """
+        now = asyncio.get_running_loop().time()
+        if now - self._last_metrics < Config.KASA_COLLECTOR_DATA_FETCH_INTERVAL:
+            return
+        self._last_metrics = now
+        points = [
+            self._build_point("kasa_collector_internal", fields, tags)
+            for fields, tags in get_metrics().influx_records()
+        ]
+        await self.write_points(points, spool=False)
+
+    async def build_points(self, samples):
+        """
+        Build and return the points for a batch of samples without queueing
+        them for flush(). Used by the backfill tool, which writes them itself.
+        """
+        pending = self._pending_points
+        self._pending_points = []
+        try:
+            await self.write(samples)
+            return self._pending_points
+        finally:
+            self._pending_points = pending
+
+    def pending_count(self):
+        """
+        Return the number of points waiting for the next flush().
+        """
+        return len(self._pending_points)
+
+    async def flush(self):
+        """
+        Write all pending points to InfluxDB.
+        """
+        while self._pending_points:
+            batch = self._pending_points[:MAX_POINTS_PER_WRITE]
+            del self._pending_points[:MAX_POINTS_PER_WRITE]
+            await self.write_points(batch)
+
+    async def write_points(self, points, spool=True):
+        """
+        Write a batch of points to InfluxDB in a single request.
+        If InfluxDB is unreachable, or already known to be down, the batch is
+        appended to the spool instead, or dropped when spool is False. A batch
+        InfluxDB rejects is set aside without marking the sink down. Returns
+        True if InfluxDB accepted it.
+        """
+        if not points:
+            return True
+
+        if self.spool and not self._sink_healthy:
+            # Don't wait on a write timeout per batch during an outage; the
+            # replay task probes InfluxDB and drains the spool when it's back
+            if spool:
+                await self._spool_points(points)
+            return False
+
+        metrics = get_metrics()
+        try:
+            with metrics.timer("sink_write_seconds"):
+                await self.write_api.write(bucket=self.bucket, record=points)
+            metrics.increment("points_written", len(points))
+            self.logger.debug(f"Wrote {len(points)} points to InfluxDB")
+            return True
+        except Exception as e:
+            metrics.increment("sink_write_errors")
+            if _is_rejected(e):
+                await self._reject_points(points, e)
+                return False
+            self.logger.error(f"Error writing {len(points)} points to InfluxDB: {e}")
+            if self.spool:
+                self._sink_healthy = False
+                if spool:
+                    await self._spool_points(points)
+            return False
+
+    async def _reject_points(self, points, error):
+        """
+        Set aside a batch InfluxDB refused: quarantined in the spool
+        directory when the spool is enabled, dropped otherwise.
+        """
+        get_metrics().increment("points_rejected", len(points))
+        self.logger.error(
+            f"InfluxDB rejected {len(points)} points "
+            f"(HTTP {error.status}), not retrying them: {error.body or error.reason}"
+        )
+        if self.spool:
+            await self.spool.quarantine(
+                [
+                    point if isinstance(point, str) else point.to_line_protocol()
+                    for point in points
+                ]
+            )
+
+    async def _spool_points(self, points):
+        """
+        Append points to the spool as line protocol.
+        """
+        try:
+            await self.spool.append(
+                [
+                    point if isinstance(point, str) else point.to_line_protocol()
+                    for point in points
+                ]
+            )
+            self.logger.debug(f"Spooled {len(points)} points for later replay")
+        except Exception as e:
+            self.logger.error(f"Error spooling {len(points)} points: {e}")
+
+    async def run_spool_replay(self):
+        """
+        Replay spooled points to InfluxDB, oldest first, in batches of
+        KASA_COLLECTOR_SPOOL_REPLAY_BATCH_SIZE and at no more than
+        KASA_COLLECTOR_SPOOL_REPLAY_RATE points per second so a long backlog
+        doesn't swamp InfluxDB. Also serves as the recovery probe after an
+        outage.
+        """
+        if not self.spool:
+            return
+
+        retry_delay = Config.KASA_COLLECTOR_INFLUXDB_FLUSH_INTERVAL
+        while True:
+            await self.spool.enforce_limits()
+            if self.spool.is_empty():
+                self._sink_healthy = True
+                await asyncio.sleep(retry_delay)
+                continue
+
+            lines = await self.spool.read_batch(
+                Config.KASA_COLLECTOR_SPOOL_REPLAY_BATCH_SIZE
+            )
+            try:
+                await self.write_api.write(bucket=self.bucket, record=lines)
+            except Exception as e:
+                if _is_rejected(e):
+                    # Retrying would block the rest of the spool behind it
+                    await self._reject_points(lines, e)
+                    await self.spool.commit(len(lines))
+                    continue
+                self.logger.debug(f"Spool replay failed, retrying later: {e}")
+                self._sink_healthy = False
+                await asyncio.sleep(retry_delay)
+                continue
+
+            await self.spool.commit(len(lines))
+            if not self._sink_healthy:
+                self.logger.info("InfluxDB is reachable again, replaying spool")
+                self._sink_healthy = True
+            self.logger.debug(
+                f"Replayed {len(lines)} spooled points, "
+                f"{self.spool.stats()['segments']} segments remaining"
+            )
+            await asyncio.sleep(len(lines) / Config.KASA_COLLECTOR_SPOOL_REPLAY_RATE)
+
     async def write_data(self, measurement, data, tags=None):
         """
         Write data to InfluxDB.
         """
-        point = Point(measurement).time(datetime.utcnow())
+        point = self._build_point(measurement, data, tags)
+        await self.send_to_influxdb([point])
+        self.logger.debug(
+            f"Queued data for InfluxDB: {measurement}, Tags: {tags}, Data: {data}"
+        )
+
+    @staticmethod
+    def _build_point(measurement, data, tags=None):
+        """
+        Build a point timestamped now from a dict of fields and optional tags.
+        """
+        point = Point(measurement).time(datetime.now(timezone.utc))
         for k, v in data.items():
             point = point.field(k, v)
         if tags:
             for k, v in tags.items():
                 point = point.tag(k, v)
+        return point
 
-        self.write_api.write(bucket=self.bucket, org=self.client.org, record=point)
-        self.logger.debug(
-            f"Wrote data to InfluxDB: {measurement}, Tags: {tags}, Data: {data}"
-        )
-
-    async def process_emeter_data(self, device_data):
+    async def process_emeter_data(self, device_data, timestamp=None):
         """
         Process emeter data and send it to InfluxDB.
+        timestamp is when the reading was taken, in nanoseconds since the epoch.
+        Lines are encoded directly from the cached series prefix, so a sample
+        only costs formatting its fields.
         """
         try:
-            points = []
+            if timestamp is None:
+                timestamp = sample_timestamp()
+            lines = []
             for ip, data in device_data.items():
-                emeter_data = data.get("emeter", {})
-                alias = data.get("alias", "unknown")
-                dns_name = data.get("dns_name", "unknown")
-                equipment_type = data.get("equipment_type", "device")
-
-                # Fetch the sysinfo for this device
-                sysinfo = self.sysinfo_data.get(ip, {}).get("sysinfo", {})
-                device_id = sysinfo.get("deviceId", None)  # Get device_id from sysinfo
-                children = sysinfo.get("children", [])
-
-                # Log for sysinfo lookup
-                self.logger.debug(f"Lookup sysinfo for {ip}: {sysinfo}")
-
-                # Determine if it's a plug on a power strip
-                plug_alias = data.get(
-                    "plug_alias", alias
-                )  # Default plug alias to device alias
-                plug_id = None
-
-                if children:
-                    # This is a power strip with child plugs
-                    plug_info = self._get_plug_info_from_sysinfo_by_alias(
-                        sysinfo, plug_alias
-                    )
-                    if plug_info:
-                        plug_id = plug_info.get(
-                            "plug_id", f"{len(children)}"
-                        )  # Use numeric plug_id (1, 2, 3, ...)
-                        plug_alias = plug_info.get("alias", plug_alias)
-                    self.logger.debug(
-                        f"Found plug_alias={plug_alias}, plug_id={plug_id} for ip={ip}"
-                    )
+                emeter_data = data.get("emeter")
+                if not emeter_data:
+                    continue
+                prefix = self._emeter_prefix(ip, data)
+                line = encode_line(prefix, emeter_data, timestamp)
+                if line:
+                    lines.append(line)
 
-                # Log Device Alias and IDs for debugging
-                self.logger.debug(f"Device Alias: {alias}, Device ID: {device_id}")
+            await self.send_to_influxdb(lines)
 
-                for metric, value in emeter_data.items():
-                    point = (
-                        Point("emeter")
-                        .tag("ip", ip)
-                        .tag("dns_name", dns_name)
-                        .tag("device_alias", alias)
-                        .tag("equipment_type", equipment_type)
-                    )
+        except Exception as e:
+            self.logger.error(f"Error processing emeter data for InfluxDB: {e}")
 
-                    # Add device_id for all devices if available
-                    if device_id:
-                        point = point.tag("device_id", device_id)
+    def _emeter_prefix(self, ip, data):
+        """
+        Return the escaped emeter series prefix of a device or strip outlet.
+        Cached per (ip, plug_alias) and rebuilt when the alias, hostname or
+        equipment type changes; a sysinfo change drops the device's entries.
+        """
+        alias = data.get("alias", "unknown")
+        dns_name = data.get("dns_name", "unknown")
+        equipment_type = data.get("equipment_type", "device")
+        identity = (alias, dns_name, equipment_type)
+
+        series = self._series.setdefault(ip, {})
+        cached = series.get(data.get("plug_alias"))
+        if cached is not None and cached[0] == identity:
+            return cached[1]
+
+        # Fetch the sysinfo for this device
+        sysinfo = self.sysinfo_data.get(ip, {}).get("sysinfo", {})
+        device_id = sysinfo.get("deviceId", None)  # Get device_id from sysinfo
+        children = sysinfo.get("children", [])
 
-                    # Add plug-specific tags if this is a plug
-                    if plug_id:
-                        point = point.tag("plug_alias", plug_alias).tag(
-                            "plug_id", plug_id
-                        )
+        # Determine if it's a plug on a power strip
+        plug_alias = data.get("plug_alias", alias)  # Default plug alias to device alias
+        plug_id = None
 
-                    point = point.field(metric, value)
-                    point = point.time(datetime.now(timezone.utc))
-                    points.append(point)
+        if children:
+            # This is a power strip with child plugs
+            plug_info = self._get_plug_info_from_sysinfo_by_alias(sysinfo, plug_alias)
+            if plug_info:
+                plug_id = plug_info.get(
+                    "plug_id", f"{len(children)}"
+                )  # Use numeric plug_id (1, 2, 3, ...)
+                plug_alias = plug_info.get("alias", plug_alias)
 
-            await self.send_to_influxdb(points)
-            await self._append_to_file(device_data)
+        self.logger.debug(
+            f"Built emeter series for ip={ip}: alias={alias}, device_id={device_id}, "
+            f"plug_alias={plug_alias}, plug_id={plug_id}"
+        )
 
-        except Exception as e:
-            self.logger.error(f"Error processing emeter data for InfluxDB: {e}")
+        tags = {
+            "ip": ip,
+            "dns_name": dns_name,
+            "device_alias": alias,
+            "equipment_type": equipment_type,
+        }
+        # Add device_id for all devices if available
+        if device_id:
+            tags["device_id"] = device_id
+        # Add plug-specific tags if this is a plug
+        if plug_id:
+            tags["plug_alias"] = plug_alias
+            tags["plug_id"] = plug_id
+
+        prefix = series_prefix("emeter", tags)
+        series[data.get("plug_alias")] = (identity, prefix)
+        return prefix
 
     def _get_plug_info_from_sysinfo_by_alias(self, sysinfo, plug_alias):
         """
@@ -273,18 +517,30 @@ class InfluxDBStorage:
                 return child
         return None
 
-    async def process_sysinfo_data(self, device_data):
+    async def process_sysinfo_data(self, device_data, timestamp=None):
         """
         Process sysinfo data and store it for later use in emeter processing.
+        timestamp is when the reading was taken, in nanoseconds since the epoch.
         """
         try:
-            # Store the sysinfo data for later use in emeter processing
+            if timestamp is None:
+                timestamp = sample_timestamp()
+            # Store the sysinfo data for later use in emeter processing. The
+            # cached emeter series of a device depend on its device_id and
+            # outlet aliases, so drop them when those change.
+            for ip, data in device_data.items():
+                if self._series_identity(self.sysinfo_data.get(ip)) != (
+                    self._series_identity(data)
+                ):
+                    self._series.pop(ip, None)
             self.sysinfo_data.update(device_data)
 
-            # Log for adding sysinfo data
-            self.logger.debug(
-                f"Updated sysinfo data: {json.dumps(self.sysinfo_data, indent=4)}"
-            )
+            # Only build expensive debug output when it will be logged
+            debug = self.logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                self.logger.debug(
+                    f"Updated sysinfo data: {json.dumps(device_data, indent=4)}"
+                )
 
             points = []
             for ip, data in device_data.items():
@@ -308,7 +564,7 @@ class InfluxDBStorage:
                 for key, value in normalized_sysinfo.items():
                     point = point.field(key, self._format_value(value))
 
-                point = point.time(datetime.now(timezone.utc))
+                point = point.time(timestamp)
                 points.append(point)
 
                 # Process child devices (plugs) and assign sequential plug_id values
@@ -335,18 +591,28 @@ class InfluxDBStorage:
                                 key, self._format_value(value)
                             )
 
-                    child_point = child_point.time(datetime.now(timezone.utc))
+                    child_point = child_point.time(timestamp)
                     points.append(child_point)
 
-                self.logger.debug(f"Full sysinfo data: {normalized_sysinfo}")
+                if debug:
+                    self.logger.debug(f"Full sysinfo data: {normalized_sysinfo}")
 
-            self.logger.debug(f"Collected points for InfluxDB: {points}")
+            if debug:
+                self.logger.debug(f"Collected {len(points)} points for InfluxDB")
             await self.send_to_influxdb(points)
-            await self._append_to_file(device_data)
 
         except Exception as e:
             self.logger.error(f"Error processing sysinfo data for InfluxDB: {e}")
 
+    @staticmethod
+    def _series_identity(data):
+        """Return the sysinfo values that emeter series tags are built from."""
+        sysinfo = (data or {}).get("sysinfo", {})
+        return (
+            sysinfo.get("deviceId"),
+            tuple(child.get("alias") for child in sysinfo.get("children", [])),
+        )
+
     def normalize_sysinfo(self, sysinfo):
         """
         Normalize sysinfo data to standardize fields and handle variations,
@@ -379,47 +645,18 @@ class InfluxDBStorage:
 
     async def send_to_influxdb(self, points):
         """
-        Send data points to InfluxDB.
+        Add data points or encoded lines to the pending batch written by the
+        next flush().
         """
         try:
-            for point in points:
-                self.logger.debug(f"Sending to InfluxDB: {point.to_line_protocol()}")
-                self.write_api.write(bucket=self.bucket, record=point)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                for point in points:
+                    line = point if isinstance(point, str) else point.to_line_protocol()
+                    self.logger.debug(f"Sending to InfluxDB: {line}")
+            self._pending_points.extend(points)
         except Exception as e:
             self.logger.error(f"Error sending data to InfluxDB: {e}")
 
-    async def _append_to_file(self, data):
-        """
-        Append device data to individual files based on type (sysinfo or emeter).
-        """
-        try:
-            output_dir = Config.KASA_COLLECTOR_OUTPUT_DIR
-            os.makedirs(output_dir, exist_ok=True)
-
-            for ip, device_data in data.items():
-                alias = (
-                    device_data.get("alias") or device_data.get("device_alias") or ip
-                )
-                dns_name = device_data.get("dns_name", "")
-                identifier = alias or dns_name or ip
-                sanitized_identifier = "".join(
-                    c if c.isalnum() or c in "-_." else "_" for c in identifier
-                )
-                file_type = "emeter" if "emeter" in device_data else "sysinfo"
-                filename = os.path.join(
-                    output_dir, f"{file_type}_{sanitized_identifier}.json"
-                )
-
-                # Append data to the file instead of overwriting it
-                async with aiofiles.open(filename, "a") as f:
-                    await f.write(json.dumps({ip: device_data}, indent=4) + "\n")
-                    self.logger.debug(
-                        f"Appended {file_type} data to JSON file: {filename}"
-                    )
-
-        except Exception as e:
-            self.logger.error(f"Error writing data to file: {e}")
-
     def _format_value(self, value):
         """
         Format values for InfluxDB points.
@@ -430,8 +667,14 @@ class InfluxDBStorage:
             return ",".join(map(str, value))
         return str(value)
 
-    def close(self):
+    async def close(self):
         """
-        Close the InfluxDB client.
+        Write queued samples, flush pending points and close the InfluxDB
+        clients.
         """
+        if self.write_api is not None:
+            await super().close()
+        if self.async_client is not None:
+            await self.async_client.close()
+            self.async_client = None
         self.client.close()
@@ -0,0 +1,155 @@
+"""
+Persistent device inventory for warm starts.
+Remembers how each device was last connected so a restart can reconnect
+directly instead of going through discovery and the authentication fallbacks.
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Any, Optional
+
+import aiofiles
+from kasa import Credentials, DeviceConfig
+from kasa.deviceconfig import DeviceConnectionParameters
+from config import Config
+
+type InventoryEntry = dict[str, Any]
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_VERSION = 1
+
+
+class DeviceInventory:
+    """
+    JSON file of the connection parameters of every connected device.
+
+    Entries hold the host, connection type (family, encryption, login
+    version, https/port), winning connection strategy, device class, emeter
+    capability and child layout.
+    Credentials are never written; they are taken from the configuration
+    again when a device is reconnected.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = Config.KASA_COLLECTOR_INVENTORY_FILE
+        self.path = path
+        self.entries: dict[str, InventoryEntry] = self._load()
+        self._dirty = False
+
+    def _load(self) -> dict[str, InventoryEntry]:
+        """Read the inventory written by a previous run."""
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable device inventory {self.path}: {e}")
+            return {}
+
+        if data.get("version") != INVENTORY_VERSION:
+            logger.info(
+                f"Ignoring device inventory with unknown version: {self.path}"
+            )
+            return {}
+        return data.get("devices", {})
+
+    def record(self, key: str, device, strategy: Optional[str] = None):
+        """
+        Remember how a successfully connected device was reached, including
+        the connection strategy that first worked for it.
+        """
+        try:
+            config = device.config
+            connection = config.connection_type
+            entry = {
+                "host": config.host,
+                "port_override": config.port_override,
+                "timeout": config.timeout,
+                "connection": {
+                    "device_family": connection.device_family.value,
+                    "encryption_type": connection.encryption_type.value,
+                    "login_version": connection.login_version,
+                    "https": connection.https,
+                    "http_port": connection.http_port,
+                },
+                "strategy": strategy,
+                "device_class": device.__class__.__name__,
+                "has_emeter": bool(getattr(device, "has_emeter", False)),
+                "children": [
+                    child.alias for child in getattr(device, "children", [])
+                ],
+                "alias": getattr(device, "alias", None),
+                "updated_at": int(time.time()),
+            }
+        except Exception as e:
+            logger.debug(f"Could not record {key} in device inventory: {e}")
+            return
+
+        previous = self.entries.get(key)
+        if previous is not None:
+            previous = {k: v for k, v in previous.items() if k != "updated_at"}
+        if previous != {k: v for k, v in entry.items() if k != "updated_at"}:
+            self.entries[key] = entry
+            self._dirty = True
+
+    def forget(self, key: str):
+        """Drop a device that is no longer managed."""
+        if self.entries.pop(key, None) is not None:
+            self._dirty = True
+
+    @staticmethod
+    def device_config(
+        entry: InventoryEntry,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+    ) -> DeviceConfig:
+        """
+        Build the DeviceConfig to reconnect a device from its inventory entry.
+        """
+        connection = entry["connection"]
+        return DeviceConfig(
+            host=entry["host"],
+            port_override=entry.get("port_override"),
+            timeout=entry.get("timeout") or Config.KASA_COLLECTOR_AUTH_TIMEOUT,
+            credentials=(
+                Credentials(username=username, password=password)
+                if username and password
+                else None
+            ),
+            connection_type=DeviceConnectionParameters.from_values(
+                connection["device_family"],
+                connection["encryption_type"],
+                login_version=connection.get("login_version"),
+                https=connection.get("https"),
+                http_port=connection.get("http_port"),
+            ),
+        )
+
+    async def save(self):
+        """
+        Write the inventory if it changed. The file is replaced atomically so
+        a crash never leaves a truncated inventory behind.
+        """
+        if not self._dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            async with aiofiles.open(tmp_path, "w") as f:
+                await f.write(
+                    json.dumps(
+                        {"version": INVENTORY_VERSION, "devices": self.entries},
+                        indent=2,
+                        sort_keys=True,
+                    )
+                )
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            logger.debug(f"Saved {len(self.entries)} devices to {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to save device inventory {self.path}: {e}")
@@ -1,21 +1,34 @@
 import asyncio
-from kasa import Discover, Device, DeviceConfig, Credentials
+from kasa import Discover, Device, DeviceConfig, Credentials, Module
+from kasa.iot import IotDevice, IotStrip
 import socket
 import logging
 from config import Config
+from dns_cache import get_hostname_cached
+from utils import limit_concurrency
+from logging_utils import configure_logging
+from connection_profiles import (
+    get_connection_profiles,
+    STRATEGY_DISCOVER_SINGLE,
+    STRATEGY_CONNECT_CREDENTIALS,
+    STRATEGY_CONNECT,
+)
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+configure_logging()
 logger = logging.getLogger("KasaAPI")
 logger.setLevel(Config.KASA_COLLECTOR_LOG_LEVEL_KASA_API)
 
+# Polls a strip is read one outlet at a time before the single multi-outlet
+# request is tried again, in case it failed for a passing reason
+COMBINED_RETRY_POLLS = 60
+
 
 class KasaAPI:
     _first_discovery_complete = False  # Class variable to track first discovery
+    # Strips whose last multi-outlet request failed: host -> polls to go
+    # before it is tried again
+    _per_outlet_strips: dict[str, int] = {}
 
     @staticmethod
     async def discover_devices():
@@ -38,9 +51,12 @@ class KasaAPI:
         )
         logger.info(f"Discovered {len(devices)} devices")
 
-        # Log each device discovered, but avoid mentioning emeter until authenticated
-        for ip, device in devices.items():
-            device_info = await KasaAPI.get_device_info(device)
+        # Log each device discovered, but avoid mentioning emeter until authenticated.
+        # Hostnames are resolved for all devices at once.
+        device_infos = await asyncio.gather(
+            *(KasaAPI.get_device_info(device) for device in devices.values())
+        )
+        for device, device_info in zip(devices.values(), device_infos):
             # Add debugging info about device type and protocol
             device_type = getattr(device, "device_type", "unknown")
             device_family = getattr(device, "family", "unknown")
@@ -65,6 +81,23 @@ class KasaAPI:
         return devices
 
     @staticmethod
+    async def probe_host(ip):
+        """
+        Send a unicast discovery request to a single address.
+        Returns the discovered device, or None if it isn't a supported device.
+        Raises if nothing answers within the discovery timeout.
+        """
+        username = Config.KASA_COLLECTOR_TPLINK_USERNAME
+        password = Config.KASA_COLLECTOR_TPLINK_PASSWORD
+        credentials = Credentials(username, password) if username and password else None
+        return await Discover.discover_single(
+            ip,
+            discovery_timeout=Config.KASA_COLLECTOR_DISCOVERY_TIMEOUT,
+            credentials=credentials,
+        )
+
+    @staticmethod
+    @limit_concurrency
     async def authenticate_discovered_device(device, username=None, password=None):
         """
         Authenticate a discovered device.
@@ -126,11 +159,19 @@ class KasaAPI:
             return False
 
     @staticmethod
-    async def get_device(ip_or_hostname, username=None, password=None):
+    async def get_device(
+        ip_or_hostname, username=None, password=None, preferred_strategy=None
+    ):
         """
         Get a Kasa device by IP address or hostname.
         Attempt to use credentials if provided.
-        Uses Device.connect() for better performance as recommended by the API.
+
+        If the device has connected before, its cached connection profile is
+        tried first. Otherwise, or if that fails, the strategies are tried in
+        order: discover_single, Device.connect with credentials, then
+        Device.connect without them, starting with preferred_strategy (e.g. the
+        one saved in the inventory) when given. The strategy that works is
+        cached.
         """
         try:
             # Resolve hostname to IP if necessary using async DNS resolution
@@ -141,66 +182,48 @@ class KasaAPI:
             logger.error(f"Failed to resolve hostname: {ip_or_hostname}")
             raise
 
-        device = None
-        
-        # First try discover_single for better cross-subnet compatibility
-        # This properly detects device type and protocol
-        try:
-            logger.debug(f"Attempting discover_single for {ip}")
-            device = await Discover.discover_single(
-                ip,
-                credentials=Credentials(username=username, password=password) if username and password else None
-            )
-            if device:
-                await device.update()
+        profiles = get_connection_profiles()
+        profile = profiles.get(ip_or_hostname)
+        if profile is not None:
+            try:
+                device = await KasaAPI.connect_with_config(profile.config)
+                profiles.record_hit()
+                return device
+            except Exception as e:
                 logger.debug(
-                    f"Connected to device via discovery: "
-                    f"{device.alias if device.alias else device.model} (IP: {ip})"
+                    f"Cached {profile.strategy} profile failed for {ip}: {e}. "
+                    f"Falling back to full connection sequence."
                 )
-                return device
-        except Exception as discover_error:
-            logger.debug(f"discover_single failed for {ip}: {discover_error}")
-            # Fall through to try Device.connect
-        
-        try:
-            # Fallback to direct connection if discovery fails
-            if username and password:
-                # Create config with credentials for authenticated devices
-                credentials = Credentials(username=username, password=password)
-                config = DeviceConfig(
-                    host=ip,
-                    credentials=credentials,
-                    timeout=Config.KASA_COLLECTOR_AUTH_TIMEOUT,
+                profiles.invalidate(ip_or_hostname)
+                profiles.record_miss()
+
+        strategies = [STRATEGY_DISCOVER_SINGLE]
+        if username and password:
+            strategies.append(STRATEGY_CONNECT_CREDENTIALS)
+        strategies.append(STRATEGY_CONNECT)
+        if preferred_strategy in strategies:
+            strategies.remove(preferred_strategy)
+            strategies.insert(0, preferred_strategy)
+
+        last_error = None
+        for strategy in strategies:
+            try:
+                device = await KasaAPI._connect_with_strategy(
+                    strategy, ip, username, password
                 )
-                try:
-                    device = await Device.connect(config=config)
-                    logger.debug(
-                        f"Connected to authenticated device: "
-                        f"{device.alias if device.alias else device.model} (IP: {ip})"
-                    )
-                except Exception as auth_error:
-                    logger.warning(f"Failed to connect with credentials: {auth_error}")
-                    # Try without credentials as fallback
-                    try:
-                        device = await Device.connect(host=ip)
-                        logger.debug(
-                            f"Connected to device without authentication: "
-                            f"{device.alias if device.alias else device.model} (IP: {ip})"
-                        )
-                    except Exception as fallback_error:
-                        logger.error(f"Failed to connect without credentials: {fallback_error}")
-                        raise
-            else:
-                # Connect without credentials for devices without authentication
-                device = await Device.connect(host=ip)
-                logger.debug(
-                    f"Connected to device: "
-                    f"{device.alias if device.alias else device.model} (IP: {ip})"
+            except Exception as e:
+                last_error = e
+                # discover_single commonly fails across subnets, so it is
+                # only logged at debug level
+                log = (
+                    logger.debug
+                    if strategy == STRATEGY_DISCOVER_SINGLE
+                    else logger.warning
                 )
+                log(f"{strategy} failed for {ip}: {e}")
+                continue
 
-            # Ensure full initialization by calling update
-            await device.update()
-
+            profiles.record(ip_or_hostname, strategy, device.config)
             # Check if the device has emeter capability
             if device.has_emeter:
                 logger.debug(f"Device {device.alias} supports emeter functionality.")
@@ -208,11 +231,63 @@ class KasaAPI:
                 logger.debug(
                     f"Device {device.alias} does not support emeter functionality."
                 )
+            return device
 
-        except Exception as e:
-            logger.error(f"Failed to connect to device {ip}: {e}")
-            raise
+        logger.error(f"Failed to connect to device {ip}: {last_error}")
+        raise last_error
+
+    @staticmethod
+    @limit_concurrency
+    async def _connect_with_strategy(strategy, ip, username=None, password=None):
+        """
+        Connect to a device using a single connection strategy.
+        Raises if the strategy does not produce a working device.
+        """
+        credentials = (
+            Credentials(username=username, password=password)
+            if username and password
+            else None
+        )
 
+        if strategy == STRATEGY_DISCOVER_SINGLE:
+            # Properly detects device type and protocol, and works across subnets
+            logger.debug(f"Attempting discover_single for {ip}")
+            device = await Discover.discover_single(ip, credentials=credentials)
+            if not device:
+                raise ConnectionError(f"No response to discover_single from {ip}")
+        elif strategy == STRATEGY_CONNECT_CREDENTIALS:
+            config = DeviceConfig(
+                host=ip,
+                credentials=credentials,
+                timeout=Config.KASA_COLLECTOR_AUTH_TIMEOUT,
+            )
+            device = await Device.connect(config=config)
+        elif strategy == STRATEGY_CONNECT:
+            device = await Device.connect(host=ip)
+        else:
+            raise ValueError(f"Unknown connection strategy: {strategy}")
+
+        # Ensure full initialization by calling update
+        await device.update()
+        logger.debug(
+            f"Connected to device via {strategy}: "
+            f"{device.alias if device.alias else device.model} (IP: {ip})"
+        )
+        return device
+
+    @staticmethod
+    @limit_concurrency
+    async def connect_with_config(config):
+        """
+        Connect to a device using known connection parameters.
+        Skips discovery and protocol probing, so it only works for a config
+        saved from an earlier successful connection.
+        """
+        device = await Device.connect(config=config)
+        logger.debug(
+            f"Connected to device from saved config: "
+            f"{device.alias if device.alias else device.model} (IP: {config.host})"
+        )
         return device
 
     @staticmethod
@@ -229,6 +304,202 @@ class KasaAPI:
         logger.debug(f"Fetched emeter data for device {device.model}")
         return device.emeter_realtime
 
+    @staticmethod
+    async def fetch_emeter_realtime(device):
+        """
+        Fetch realtime energy readings by querying only the energy module.
+        Unlike update(), this skips the schedule, time, cloud and usage modules,
+        so the device only has to answer a single realtime request.
+        """
+        energy = device.modules.get(Module.Energy)
+        if energy is None:
+            raise ValueError(
+                f"Device {device.host} does not expose an energy module."
+            )
+        reading = dict(await energy.get_status())
+        logger.debug(f"Fetched realtime emeter data for {device.host}: {reading}")
+        return reading
+
+    @staticmethod
+    async def fetch_strip_emeter_realtime(strip):
+        """
+        Fetch realtime energy readings for every outlet of a power strip.
+        Returns the strip totals (outlets summed, voltage averaged) and the
+        per-outlet readings in the same order as strip.children.
+        The outlet requests share the strip's connection, which sends them one
+        at a time.
+        """
+        child_readings = await asyncio.gather(
+            *(KasaAPI.fetch_emeter_realtime(child) for child in strip.children)
+        )
+        return KasaAPI._sum_outlet_readings(child_readings), child_readings
+
+    @staticmethod
+    def _sum_outlet_readings(child_readings):
+        """
+        Return the strip totals of per-outlet readings: outlets summed,
+        voltage averaged.
+        """
+        totals = {}
+        for reading in child_readings:
+            for key, value in reading.items():
+                totals[key] = totals.get(key, 0) + value
+
+        # Voltage is shared by all outlets, so average it instead of summing
+        for key in ("voltage_mv", "voltage"):
+            if key in totals and child_readings:
+                totals[key] = totals[key] / len(child_readings)
+
+        return totals
+
+    @staticmethod
+    def supports_combined_query(device):
+        """Return True for IOT-protocol devices with an energy meter."""
+        return isinstance(device, IotDevice) and device.has_emeter
+
+    @staticmethod
+    async def fetch_iot_combined(device, include_sysinfo=True):
+        """
+        Read an IOT device's sysinfo and realtime energy with raw protocol
+        requests that target several modules at once, without update().
+        A plug answers a single request. A strip is sent a single request
+        whose context lists every outlet, and is expected to answer with one
+        reading per outlet (see _fetch_strip_outlets).
+
+        Sysinfo in the reply replaces the device's cached sysinfo, so alias
+        changes show up without update(). If a strip's outlets no longer match
+        its children, the strip is refreshed with update() and read again.
+
+        Returns (sysinfo or None, emeter reading, outlet readings or None);
+        outlet readings are in the same order as strip.children.
+        """
+        if not isinstance(device, IotStrip):
+            request = {device.emeter_type: {"get_realtime": {}}}
+            if include_sysinfo:
+                request["system"] = {"get_sysinfo": {}}
+            response = await device.protocol.query(request)
+            sysinfo = None
+            if include_sysinfo:
+                sysinfo = KasaAPI._module_result(response, "system", "get_sysinfo")
+                KasaAPI._apply_sysinfo(device, sysinfo)
+            emeter = KasaAPI._module_result(
+                response, device.emeter_type, "get_realtime"
+            )
+            return sysinfo, emeter, None
+
+        sysinfo, child_readings = await KasaAPI._fetch_strip_outlets(
+            device, include_sysinfo
+        )
+        if sysinfo is not None and not KasaAPI._apply_sysinfo(device, sysinfo):
+            logger.info(f"Outlets of {device.host} changed, refreshing the strip")
+            # update() only builds the children of a strip that has none
+            device._children = {}
+            await device.update()
+            sysinfo, child_readings = await KasaAPI._fetch_strip_outlets(
+                device, include_sysinfo
+            )
+        return sysinfo, KasaAPI._sum_outlet_readings(child_readings), child_readings
+
+    @staticmethod
+    async def _fetch_strip_outlets(strip, include_sysinfo):
+        """
+        Return (sysinfo or None, outlet readings) for a strip.
+
+        Firmware that rejects a request listing every outlet, or answers it
+        with a single reading that can't be attributed to an outlet, is read
+        with one request per outlet instead, plus one for sysinfo when it is
+        wanted. Those requests share the strip's connection, which sends them
+        one at a time. The multi-outlet request is tried again after
+        COMBINED_RETRY_POLLS polls.
+        """
+        sysinfo_request = {"system": {"get_sysinfo": {}}}
+        emeter_request = {strip.emeter_type: {"get_realtime": {}}}
+        sysinfo = None
+
+        polls_left = KasaAPI._per_outlet_strips.pop(strip.host, 0)
+        if polls_left > 1:
+            KasaAPI._per_outlet_strips[strip.host] = polls_left - 1
+        if not polls_left:
+            child_ids = [child.child_id for child in strip.children]
+            request = {"context": {"child_ids": child_ids}, **emeter_request}
+            if include_sysinfo:
+                request.update(sysinfo_request)
+            response = await strip.protocol.query(request)
+            try:
+                child_readings = KasaAPI._outlet_results(
+                    response, strip.emeter_type, "get_realtime", len(child_ids)
+                )
+                if include_sysinfo:
+                    sysinfo = KasaAPI._module_result(
+                        response, "system", "get_sysinfo"
+                    )
+            except ValueError as e:
+                KasaAPI._per_outlet_strips[strip.host] = COMBINED_RETRY_POLLS
+                logger.info(
+                    f"{strip.host} can't read all outlets in one request, using "
+                    f"one request per outlet for {COMBINED_RETRY_POLLS} polls: {e}"
+                )
+            else:
+                logger.debug(f"Fetched combined data for {strip.host} in 1 request")
+                return sysinfo, child_readings
+
+        requests = [
+            {"context": {"child_ids": [child.child_id]}, **emeter_request}
+            for child in strip.children
+        ]
+        if include_sysinfo:
+            requests.append(sysinfo_request)
+        responses = await asyncio.gather(
+            *(strip.protocol.query(request) for request in requests)
+        )
+        child_readings = [
+            KasaAPI._module_result(response, strip.emeter_type, "get_realtime")
+            for response in responses[: len(strip.children)]
+        ]
+        if include_sysinfo:
+            sysinfo = KasaAPI._module_result(responses[-1], "system", "get_sysinfo")
+        logger.debug(
+            f"Fetched combined data for {strip.host} in {len(requests)} requests"
+        )
+        return sysinfo, child_readings
+
+    @staticmethod
+    def _apply_sysinfo(device, sysinfo):
+        """
+        Replace a device's cached sysinfo with one from a combined reply.
+        Strip outlets read their aliases from it too. Returns False if a
+        strip's outlets no longer match its children.
+        """
+        device._set_sys_info(sysinfo)
+        if isinstance(device, IotStrip):
+            outlet_ids = [outlet.get("id") for outlet in sysinfo.get("children", [])]
+            return outlet_ids == [child.child_id for child in device.children]
+        return True
+
+    @staticmethod
+    def _module_result(response, module, method):
+        """Return one module's result from a combined IOT response."""
+        result = response.get(module, {}).get(method)
+        if not isinstance(result, dict) or result.get("err_code", 0) != 0:
+            raise ValueError(f"No valid {module}.{method} in response: {result}")
+        return {key: value for key, value in result.items() if key != "err_code"}
+
+    @staticmethod
+    def _outlet_results(response, module, method, count):
+        """
+        Return the per-outlet results of a response to a request addressing
+        count outlets, in request order.
+        """
+        results = response.get(module, {}).get(method)
+        if not isinstance(results, list) or len(results) != count:
+            raise ValueError(
+                f"Expected {count} {module}.{method} results, got: {results}"
+            )
+        return [
+            KasaAPI._module_result({module: {method: result}}, module, method)
+            for result in results
+        ]
+
     @staticmethod
     async def fetch_sysinfo(device):
         """
@@ -257,18 +528,6 @@ class KasaAPI:
             data["sys_info"] = device.sys_info
         return data
 
-    @staticmethod
-    async def _async_dns_lookup(ip):
-        """
-        Perform an asynchronous DNS lookup to get the hostname for an IP address.
-        """
-        loop = asyncio.get_event_loop()
-        try:
-            return await loop.getnameinfo((ip, 0), socket.NI_NAMEREQD)
-        except Exception as e:
-            logger.warning(f"DNS lookup failed for {ip}: {e}")
-            return "unknown"
-
     @staticmethod
     async def get_device_info(device):
         """
@@ -282,12 +541,8 @@ class KasaAPI:
         """
         ip = device.host
 
-        try:
-            # Attempt DNS lookup
-            dns_name = await KasaAPI._async_dns_lookup(ip)
-        except Exception as e:
-            logger.warning(f"DNS lookup failed for {ip}: {e}")
-            dns_name = "unknown"
+        # Shares the collector's DNS cache, so each IP is looked up once
+        dns_name = await get_hostname_cached(ip)
 
         try:
             # Use alias if available, otherwise fallback to model name or "unknown"
@@ -2,16 +2,15 @@ import asyncio
 import logging
 import os
 from config import Config
+from logging_utils import configure_logging
 from device_manager import DeviceManager
 from poller import Poller
+from metrics_server import MetricsServer
+from dns_cache import get_dns_cache
 
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+configure_logging()
 logger = logging.getLogger("KasaCollector")
 logger.setLevel(Config.KASA_COLLECTOR_LOG_LEVEL_KASA_COLLECTOR)
 
@@ -22,6 +21,7 @@ class KasaCollector:
         self.device_manager = DeviceManager(self.logger)
         self.tasks = set()  # Store task references
         self.influxdb_storage = None  # Will be initialized when needed
+        self.metrics_server = None  # Started in start() when enabled
         self.check_required_configs()
 
         # Initialize poller after config check
@@ -39,12 +39,17 @@ class KasaCollector:
         Ensure that all required configuration details are present.
         If any required config is missing, raise an error and exit.
         """
-        required_configs = {
-            "InfluxDB URL": Config.KASA_COLLECTOR_INFLUXDB_URL,
-            "InfluxDB Token": Config.KASA_COLLECTOR_INFLUXDB_TOKEN,
-            "InfluxDB Organization": Config.KASA_COLLECTOR_INFLUXDB_ORG,
-            "InfluxDB Bucket": Config.KASA_COLLECTOR_INFLUXDB_BUCKET,
-        }
+        required_configs = {}
+        # InfluxDB settings are only needed when InfluxDB is a selected sink
+        if "influxdb" in Config.KASA_COLLECTOR_SINKS:
+            required_configs.update(
+                {
+                    "InfluxDB URL": Config.KASA_COLLECTOR_INFLUXDB_URL,
+                    "InfluxDB Token": Config.KASA_COLLECTOR_INFLUXDB_TOKEN,
+                    "InfluxDB Organization": Config.KASA_COLLECTOR_INFLUXDB_ORG,
+                    "InfluxDB Bucket": Config.KASA_COLLECTOR_INFLUXDB_BUCKET,
+                }
+            )
 
         missing_configs = [
             name for name, value in required_configs.items() if not value
@@ -76,12 +81,16 @@ class KasaCollector:
 
         # Log the confirmation of key configurations
         self.logger.info("Configuration:")
-        self.logger.info(f"  InfluxDB URL: {Config.KASA_COLLECTOR_INFLUXDB_URL}")
-        self.logger.info(f"  InfluxDB Token: {obfuscated_token}")  # Obfuscated token
-        self.logger.info(f"  InfluxDB Bucket: {Config.KASA_COLLECTOR_INFLUXDB_BUCKET}")
-        self.logger.info(
-            f"  InfluxDB Organization: {Config.KASA_COLLECTOR_INFLUXDB_ORG}"
-        )
+        self.logger.info(f"  Sinks: {', '.join(Config.KASA_COLLECTOR_SINKS)}")
+        if "influxdb" in Config.KASA_COLLECTOR_SINKS:
+            self.logger.info(f"  InfluxDB URL: {Config.KASA_COLLECTOR_INFLUXDB_URL}")
+            self.logger.info(f"  InfluxDB Token: {obfuscated_token}")  # Obfuscated
+            self.logger.info(
+                f"  InfluxDB Bucket: {Config.KASA_COLLECTOR_INFLUXDB_BUCKET}"
+            )
+            self.logger.info(
+                f"  InfluxDB Organization: {Config.KASA_COLLECTOR_INFLUXDB_ORG}"
+            )
         self.logger.info("=" * 60)
 
     async def start(self):
@@ -90,32 +99,79 @@ class KasaCollector:
         and starting periodic tasks.
         """
         try:
-            # Initialize manual devices first
+            # Start the sinks (including the async InfluxDB client) and the
+            # storage writer before any data is collected
+            self.tasks.update(await self.poller.start_sinks())
+            if self.poller.storage:
+                replay_task = asyncio.create_task(
+                    self.poller.storage.run_spool_replay()
+                )
+                self.tasks.add(replay_task)
+            writer_task = asyncio.create_task(self.poller.run_storage_writer())
+            self.tasks.add(writer_task)
+
+            # Serve self-monitoring metrics, and device readings when the
+            # prometheus sink is selected, for scraping
+            if Config.KASA_COLLECTOR_METRICS_ENABLED or self.poller.exporter:
+                self.metrics_server = MetricsServer(exporter=self.poller.exporter)
+                try:
+                    await self.metrics_server.start()
+                except OSError as e:
+                    self.logger.error(f"Failed to start metrics endpoint: {e}")
+                    self.metrics_server = None
+
+            # Reconnect known devices straight from the saved inventory
+            restored = 0
+            if Config.KASA_COLLECTOR_WARM_START:
+                restored = await self.device_manager.restore_inventory()
+
+            # Initialize manual devices that were not restored
             await self.device_manager.initialize_manual_devices()
 
-            # Perform initial device discovery if auto-discovery is enabled
+            # Perform initial device discovery if auto-discovery is enabled.
+            # After a warm start it only reconciles changes, so polling
+            # starts without waiting for it.
             if Config.KASA_COLLECTOR_ENABLE_AUTO_DISCOVERY:
                 self.logger.debug("Starting initial device discovery...")
-                await self.device_manager.discover_devices()
-
-            # Start the poller tasks for fetching emeter and sysinfo data
-            emeter_task = asyncio.create_task(
-                self.poller.periodic_emeter_fetch(self.device_manager.emeter_devices)
-            )
-            sysinfo_task = asyncio.create_task(
-                self.poller.periodic_sysinfo_fetch(self.device_manager.emeter_devices)
+                if restored:
+                    initial_discovery_task = asyncio.create_task(
+                        self.background_discover()
+                    )
+                    self.tasks.add(initial_discovery_task)
+                else:
+                    await self.device_manager.discover_devices()
+
+            # Start the poller task for fetching emeter and sysinfo data
+            poll_task = asyncio.create_task(
+                self.poller.periodic_device_fetch(self.device_manager.emeter_devices)
             )
             discovery_task = asyncio.create_task(self.periodic_discover())
+            probe_task = asyncio.create_task(
+                self.poller.run_quarantine_probes(self.device_manager.emeter_devices)
+            )
+
+            # Drop DNS cache entries for devices that are no longer polled
+            dns_prune_task = asyncio.create_task(get_dns_cache().run_pruning())
 
             # Store task references for proper cleanup
-            self.tasks.add(emeter_task)
-            self.tasks.add(sysinfo_task)
+            self.tasks.add(poll_task)
             self.tasks.add(discovery_task)
+            self.tasks.add(probe_task)
+            self.tasks.add(dns_prune_task)
 
         except Exception as e:
             self.logger.error(f"Failed to start KasaCollector: {e}")
             raise
 
+    async def background_discover(self):
+        """
+        Run the initial discovery after a warm start without holding up polling.
+        """
+        try:
+            await self.device_manager.discover_devices()
+        except Exception as e:
+            self.logger.error(f"Error during background device discovery: {e}")
+
     async def periodic_discover(self):
         """
         Periodically discover devices on the network.
@@ -164,14 +220,18 @@ class KasaCollector:
                     f"{Config.KASA_COLLECTOR_SHUTDOWN_TIMEOUT}s"
                 )
 
+        # Stop serving metrics
+        if self.metrics_server:
+            await self.metrics_server.close()
+
         # Close InfluxDB connection if it exists
         if self.influxdb_storage:
-            self.influxdb_storage.close()
+            await self.influxdb_storage.close()
             self.logger.debug("Closed InfluxDB connection")
 
-        # Close any connections in poller and device_manager
-        if hasattr(self.poller, "storage") and self.poller.storage:
-            self.poller.storage.close()
+        # Store queued samples, flush pending points and close connections
+        if hasattr(self.poller, "storage"):
+            await self.poller.close()
             self.logger.debug("Closed poller InfluxDB connection")
 
         # Disconnect from all Kasa devices
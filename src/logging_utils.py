@@ -0,0 +1,104 @@
+"""
+Logging setup for the collector.
+Configures the root handler once, optionally with JSON output, and collapses
+repeated warnings and errors so a device outage doesn't flood the logs.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from config import Config
+from metrics import get_metrics
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Distinct messages tracked for rate limiting before the oldest is forgotten
+MAX_TRACKED_MESSAGES = 10000
+
+_configured = False
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets the first of a run of identical warning/error messages through and
+    drops repeats for interval seconds. The next occurrence after that says
+    how many were dropped. Lower levels always pass.
+    """
+
+    def __init__(self, interval: float, max_entries: int = MAX_TRACKED_MESSAGES):
+        super().__init__()
+        self.interval = interval
+        self.max_entries = max_entries
+        # (logger, level, message) -> [last emitted (monotonic), suppressed]
+        self._seen: OrderedDict[tuple, list] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.interval <= 0:
+            return True
+
+        message = record.getMessage()
+        key = (record.name, record.levelno, message)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                get_metrics().increment("log_messages_suppressed")
+                return False
+
+            suppressed = entry[1] if entry is not None else 0
+            self._seen[key] = [now, 0]
+            self._seen.move_to_end(key)
+            if len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+
+        if suppressed:
+            record.msg = (
+                f"{message} (repeated {suppressed} more times in the last "
+                f"{self.interval:g}s)"
+            )
+            record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as a single JSON object."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """
+    Set up the root log handler. Safe to call from every entry module; only
+    the first call has an effect.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    handler = logging.StreamHandler()
+    if Config.KASA_COLLECTOR_LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+    handler.addFilter(RateLimitFilter(Config.KASA_COLLECTOR_LOG_RATE_LIMIT_INTERVAL))
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
@@ -0,0 +1,191 @@
+"""
+Self-monitoring metrics for the collector.
+Keeps latency histograms, counters and gauges for the hot paths and renders
+them for InfluxDB and for the Prometheus text format.
+"""
+
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+type MetricFields = dict[str, int | float]
+type StatsSource = Callable[[], dict[str, int | float]]
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "kasa_collector"
+
+# Upper bounds (seconds) of the latency histogram buckets. All floats, so the
+# quantile fields written to InfluxDB always keep the same type.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of observed values.
+    """
+
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(float(bound) for bound in buckets)
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += float(value)
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """Return (upper bound, cumulative count) pairs, ending with +Inf."""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else f"{bound:g}", total))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+        Values beyond the last bucket report the last finite bound.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return float(bound)
+        return float(self.buckets[-1])
+
+
+class Metrics:
+    """
+    Registry of the collector's own metrics.
+
+    Histograms and counters are updated on the hot paths. Components that
+    already keep their own statistics (write queue, spool, ...) register a
+    stats source instead, which is read when metrics are exported.
+    """
+
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+        self.gauges: dict[str, float] = {}
+        self._sources: dict[str, StatsSource] = {}
+
+    def observe(self, name: str, value: float):
+        """Record a value in the named histogram."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Observe the duration of the enclosed block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def increment(self, name: str, amount: int = 1):
+        """Add to the named counter."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float):
+        """Set the named gauge. Gauges are always floats."""
+        self.gauges[name] = float(value)
+
+    def register_source(self, component: str, source: StatsSource):
+        """Export the statistics returned by source under component."""
+        self._sources[component] = source
+
+    def sources(self) -> dict[str, dict[str, int | float]]:
+        """Read every registered stats source."""
+        result = {}
+        for component, source in self._sources.items():
+            try:
+                result[component] = source()
+            except Exception as e:
+                logger.debug(f"Failed to read {component} stats: {e}")
+        return result
+
+    def influx_records(self) -> list[tuple[MetricFields, dict[str, str]]]:
+        """
+        Return (fields, tags) pairs for the kasa_collector_internal
+        measurement: one per histogram, one for all counters and gauges, and
+        one per stats source.
+        """
+        records = []
+        for name, histogram in self.histograms.items():
+            fields = {
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "p50": histogram.quantile(0.5),
+                "p95": histogram.quantile(0.95),
+                "p99": histogram.quantile(0.99),
+            }
+            for bound, count in histogram.cumulative():
+                fields[f"le_{bound.lstrip('+').lower()}"] = count
+            records.append((fields, {"component": "latency", "metric": name}))
+
+        totals = {**self.counters, **self.gauges}
+        if totals:
+            records.append((totals, {"component": "counters"}))
+
+        for component, stats in self.sources().items():
+            records.append((stats, {"component": component}))
+        return records
+
+    def render_prometheus(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for bound, count in histogram.cumulative():
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+            lines.append(f"{metric}_sum {histogram.sum}")
+            lines.append(f"{metric}_count {histogram.count}")
+
+        for name, value in sorted(self.counters.items()):
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+
+        for name, value in sorted(self.gauges.items()):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+
+        for component, stats in sorted(self.sources().items()):
+            for key, value in sorted(stats.items()):
+                metric = f"{METRIC_PREFIX}_{component}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics instance
+_metrics: Optional[Metrics] = None
+
+
+def get_metrics() -> Metrics:
+    """
+    Get the global metrics instance.
+    """
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
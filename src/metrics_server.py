@@ -0,0 +1,90 @@
+"""
+Minimal HTTP endpoint for scraping the collector's own metrics.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from config import Config
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Longest request head that is read before giving up on a client
+MAX_REQUEST_HEAD = 8192
+REQUEST_TIMEOUT = 5
+
+
+class MetricsServer:
+    """
+    Serves GET /metrics in the Prometheus text format.
+    Only the request line is interpreted; everything else gets a 404.
+
+    When an exporter is given, its cached device readings are served ahead
+    of the collector's own metrics.
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        exporter=None,
+    ):
+        self.host = host if host is not None else Config.KASA_COLLECTOR_METRICS_HOST
+        self.port = port if port is not None else Config.KASA_COLLECTOR_METRICS_PORT
+        self.exporter = exporter
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    async def start(self):
+        """Start listening for scrape requests."""
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=MAX_REQUEST_HEAD
+        )
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        """Stop accepting scrape requests."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def routes(self, path: str) -> Optional[str]:
+        """Return the body for a request path, or None if it is unknown."""
+        if path == "/metrics":
+            readings = self.exporter.render() if self.exporter else ""
+            return readings + get_metrics().render_prometheus()
+        return None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), timeout=REQUEST_TIMEOUT
+            )
+            method, _, rest = request.decode("latin-1").partition(" ")
+            path = rest.split(" ", 1)[0].split("?", 1)[0]
+
+            body = self.routes(path) if method == "GET" else None
+            if body is None:
+                status, body = "404 Not Found", "Not Found\n"
+            else:
+                status = "200 OK"
+
+            payload = body.encode()
+            writer.write(
+                (
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: close\r\n\r\n"
+                ).encode()
+                + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.debug(f"Error serving metrics request: {e}")
+        finally:
+            writer.close()
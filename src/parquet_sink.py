@@ -0,0 +1,278 @@
+"""
+Archival sink that writes emeter samples to Parquet files.
+Samples are buffered per device and written as part files every few minutes,
+then merged into one columnar file per device and period (hour or day),
+partitioned by date and device.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import Config
+from sinks import Sink, Sample
+from utils import datetime_from_ns, sample_timestamp
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Only needed for the parquet sink
+    pyarrow = None
+
+type PartitionKey = tuple[int, str]  # (period start, device_id)
+
+logger = logging.getLogger(__name__)
+
+# Samples taken per batch and the longest a sample waits to be buffered
+PARQUET_BATCH_SIZE = 1000
+PARQUET_FLUSH_INTERVAL = 10
+
+PERIOD_SECONDS = {"hour": 3600, "day": 86400}
+
+# Column name -> emeter keys, with the factor that converts each to the
+# column's unit (V, A, W, kWh). Devices report either milli-units or units.
+EMETER_COLUMNS = {
+    "voltage": (("voltage_mv", 0.001), ("voltage", 1)),
+    "current": (("current_ma", 0.001), ("current", 1)),
+    "power": (("power_mw", 0.001), ("power", 1)),
+    "total": (("total_wh", 0.001), ("total", 1)),
+}
+
+
+def _emeter_value(emeter: dict, keys) -> Optional[float]:
+    for key, factor in keys:
+        value = emeter.get(key)
+        if value is not None:
+            return value * factor
+    return None
+
+
+def _sanitize(value: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in value)
+
+
+class ParquetSink(Sink):
+    """
+    Buffers emeter samples in memory and writes them as Parquet files under
+    <archive dir>/date=YYYY-MM-DD/device=<device_id>/.
+
+    A partition's buffer is written as a part file once it reaches
+    part_rows rows or its oldest row is part_interval seconds old, which
+    bounds both memory and what a crash can lose. When the hour or day has
+    passed, the parts written for it are merged into one file. Each file is
+    complete on its own, so parts left by a crash or restart stay readable.
+
+    Sysinfo samples are not archived; they only provide the device_id and
+    outlet numbering for the emeter rows that follow them.
+    """
+
+    name = "parquet"
+
+    def __init__(
+        self,
+        archive_dir: Optional[str] = None,
+        period: Optional[str] = None,
+        compression: Optional[str] = None,
+        part_rows: Optional[int] = None,
+        part_interval: Optional[int] = None,
+    ):
+        if pyarrow is None:
+            logger.error(
+                "The parquet sink requires the pyarrow package "
+                "(pip install pyarrow)"
+            )
+            raise SystemExit(1)
+        super().__init__(
+            batch_size=PARQUET_BATCH_SIZE, flush_interval=PARQUET_FLUSH_INTERVAL
+        )
+        self.archive_dir = archive_dir or Config.KASA_COLLECTOR_PARQUET_DIR
+        self.period = PERIOD_SECONDS[period or Config.KASA_COLLECTOR_PARQUET_PERIOD]
+        self.compression = compression or Config.KASA_COLLECTOR_PARQUET_COMPRESSION
+        self.part_rows = part_rows or Config.KASA_COLLECTOR_PARQUET_FLUSH_ROWS
+        self.part_interval = (
+            part_interval or Config.KASA_COLLECTOR_PARQUET_FLUSH_INTERVAL
+        )
+        self.schema = pyarrow.schema(
+            [
+                ("timestamp", pyarrow.timestamp("us", tz="UTC")),
+                ("device_id", pyarrow.string()),
+                ("ip", pyarrow.string()),
+                ("plug_id", pyarrow.uint8()),
+                ("voltage", pyarrow.float64()),
+                ("current", pyarrow.float64()),
+                ("power", pyarrow.float64()),
+                ("total", pyarrow.float64()),
+            ]
+        )
+
+        # Latest sysinfo per device, for device_id and outlet numbering
+        self._device_ids: dict[str, str] = {}
+        self._plug_ids: dict[str, dict[str, int]] = {}
+
+        # Buffered rows, column by column, per period and device
+        self._partitions: dict[PartitionKey, dict[str, list]] = {}
+        # When each buffer got its first row (monotonic)
+        self._buffered_since: dict[PartitionKey, float] = {}
+        # Part files written for periods that have not ended yet
+        self._parts: dict[PartitionKey, list[str]] = {}
+        self.rows_buffered = 0
+        self.files_written = 0
+        self.files_merged = 0
+
+    async def start(self):
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+    async def write(self, samples: list[Sample]):
+        for sample in samples:
+            if sample["kind"] == "sysinfo":
+                self._update_sysinfo(sample["data"])
+            else:
+                timestamp = datetime_from_ns(sample.get("time") or sample_timestamp())
+                self._buffer_emeter(sample["data"], timestamp)
+
+    def _update_sysinfo(self, device_data):
+        for ip, data in device_data.items():
+            sysinfo = data.get("sysinfo", {})
+            device_id = sysinfo.get("deviceId") or sysinfo.get("device_id")
+            if device_id:
+                self._device_ids[ip] = device_id
+            self._plug_ids[ip] = {
+                child.get("alias"): index
+                for index, child in enumerate(sysinfo.get("children", []), start=1)
+            }
+
+    def _buffer_emeter(self, device_data, timestamp: datetime):
+        period_start = int(timestamp.timestamp()) // self.period * self.period
+        for ip, data in device_data.items():
+            emeter = data.get("emeter")
+            if not emeter:
+                continue
+            device_id = self._device_ids.get(ip, ip)
+            plug_id = None
+            if data.get("equipment_type") == "plug":
+                plug_id = self._plug_ids.get(ip, {}).get(data.get("plug_alias"))
+
+            columns = self._partitions.get((period_start, device_id))
+            if columns is None:
+                columns = self._partitions[(period_start, device_id)] = {
+                    name: [] for name in self.schema.names
+                }
+                self._buffered_since[(period_start, device_id)] = time.monotonic()
+            columns["timestamp"].append(timestamp)
+            columns["device_id"].append(device_id)
+            columns["ip"].append(ip)
+            columns["plug_id"].append(plug_id)
+            for column, keys in EMETER_COLUMNS.items():
+                columns[column].append(_emeter_value(emeter, keys))
+            self.rows_buffered += 1
+
+    async def periodic(self):
+        """
+        Write buffers that are full or old enough as part files, and merge
+        the parts of every partition whose period has ended.
+        """
+        current = int(time.time()) // self.period * self.period
+        now = time.monotonic()
+        await self._write_partitions(
+            [
+                key
+                for key, columns in self._partitions.items()
+                if key[0] < current
+                or len(columns["timestamp"]) >= self.part_rows
+                or now - self._buffered_since[key] >= self.part_interval
+            ]
+        )
+        await self._merge_partitions([key for key in self._parts if key[0] < current])
+
+    async def close(self):
+        """Write queued samples and every buffered partition."""
+        await super().close()
+        await self._write_partitions(list(self._partitions))
+        current = int(time.time()) // self.period * self.period
+        await self._merge_partitions([key for key in self._parts if key[0] < current])
+
+    async def _write_partitions(self, keys: list[PartitionKey]):
+        for key in keys:
+            columns = self._partitions.pop(key)
+            del self._buffered_since[key]
+            rows = len(columns["timestamp"])
+            try:
+                path = await asyncio.to_thread(self._write_file, key, columns)
+                self._parts.setdefault(key, []).append(path)
+                self.files_written += 1
+                logger.debug(f"Archived {rows} samples to {path}")
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error archiving {rows} samples for {key[1]}: {e}")
+            self.rows_buffered -= rows
+
+    async def _merge_partitions(self, keys: list[PartitionKey]):
+        for key in keys:
+            parts = self._parts.pop(key)
+            if len(parts) < 2:
+                continue
+            try:
+                path = await asyncio.to_thread(self._merge_files, key, parts)
+                self.files_merged += 1
+                logger.debug(f"Merged {len(parts)} part files into {path}")
+            except Exception as e:
+                # The parts are complete files, so nothing is lost
+                self.errors += 1
+                logger.warning(f"Error merging part files for {key[1]}: {e}")
+
+    def _new_path(self, key: PartitionKey) -> str:
+        period_start, device_id = key
+        start = datetime.fromtimestamp(period_start, timezone.utc)
+        directory = os.path.join(
+            self.archive_dir,
+            f"date={start:%Y-%m-%d}",
+            f"device={_sanitize(device_id)}",
+        )
+        os.makedirs(directory, exist_ok=True)
+        # A restart within a period adds a file rather than replacing one
+        return os.path.join(directory, f"{start:%H%M%S}-{time.time_ns()}.parquet")
+
+    def _write_file(self, key: PartitionKey, columns: dict[str, list]) -> str:
+        """Write one buffer to a new Parquet file. Runs in a worker thread."""
+        path = self._new_path(key)
+        table = pyarrow.Table.from_pydict(columns, schema=self.schema)
+        tmp_path = path + ".tmp"
+        pyarrow.parquet.write_table(table, tmp_path, compression=self.compression)
+        os.replace(tmp_path, path)
+        return path
+
+    def _merge_files(self, key: PartitionKey, parts: list[str]) -> str:
+        """
+        Copy part files into one new file, a row group per part, then remove
+        them. Only one part is held in memory at a time. Runs in a worker
+        thread.
+        """
+        path = self._new_path(key)
+        tmp_path = path + ".tmp"
+        try:
+            with pyarrow.parquet.ParquetWriter(
+                tmp_path, self.schema, compression=self.compression
+            ) as writer:
+                for part in parts:
+                    writer.write_table(
+                        pyarrow.parquet.read_table(part, schema=self.schema)
+                    )
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        for part in parts:
+            os.remove(part)
+        return path
+
+    def stats(self):
+        stats = super().stats()
+        stats["rows_buffered"] = self.rows_buffered
+        stats["partitions"] = len(self._partitions)
+        stats["files_written"] = self.files_written
+        stats["files_merged"] = self.files_merged
+        return stats
@@ -1,247 +1,505 @@
 import asyncio
-from datetime import datetime, timedelta
+import logging
 from kasa import SmartStrip
 from influxdb_storage import InfluxDBStorage
+from prometheus_exporter import PrometheusExporter
+from file_sink import FileSink
+from parquet_sink import ParquetSink
 from config import Config
-from dns_cache import get_hostname_cached
-from utils import async_retry, DeviceContext
+from kasa_api import KasaAPI
+from dns_cache import get_hostname_nowait, get_dns_cache
+from utils import async_retry, limit_concurrency, DeviceContext, sample_timestamp
+from scheduler import DeviceScheduler
+from circuit_breaker import CircuitBreaker
+from connection_profiles import get_connection_profiles
+from metrics import get_metrics
+from write_queue import WriteQueue, OVERFLOW_DROP_OLDEST
+
+# Maximum time between checks for devices added to or removed from polling
+SCHEDULE_SYNC_INTERVAL = 1.0
 
 
 class Poller:
     def __init__(self, logger):
         self.logger = logger
+        self.storage = None
+        self.exporter = None
+        self.sinks = []
         try:
-            self.storage = InfluxDBStorage()
+            if "influxdb" in Config.KASA_COLLECTOR_SINKS:
+                self.storage = InfluxDBStorage()
+                self.sinks.append(self.storage)
         except SystemExit:
             # InfluxDBStorage already logged detailed error messages
             raise
         except Exception as e:
             self.logger.error(f"Failed to initialize storage backend: {e}")
             raise SystemExit(1)
+        if "prometheus" in Config.KASA_COLLECTOR_SINKS:
+            # Latest readings served from memory at the metrics endpoint
+            self.exporter = PrometheusExporter()
+            self.sinks.append(self.exporter)
+        if "file" in Config.KASA_COLLECTOR_SINKS:
+            self.sinks.append(FileSink())
+        if "parquet" in Config.KASA_COLLECTOR_SINKS:
+            self.sinks.append(ParquetSink())
 
-    async def periodic_emeter_fetch(self, devices):
-        """
-        Periodically fetch and store emeter data from all devices.
-        Runs at the interval defined by the configuration.
-        """
-        while True:
-            start_time = datetime.now()
-            device_count = len(devices)
-            self.logger.debug(f"Starting emeter data fetch for {device_count} devices.")
+        # Samples flow from the device tasks to the storage writer through
+        # a bounded queue so slow writes never hold up device polling
+        self.write_queue = WriteQueue()
 
-            try:
-                async with asyncio.TaskGroup() as tg:
-                    for ip, device in devices.items():
-                        tg.create_task(self.fetch_and_store_emeter_data(ip, device))
-            except* (ConnectionError, TimeoutError, OSError) as eg:
-                for exc in eg.exceptions:
-                    self.logger.error(f"Network error during emeter fetch: {exc}")
-            except* Exception as eg:
-                for exc in eg.exceptions:
-                    if isinstance(exc, asyncio.CancelledError):
-                        self.logger.info("Emeter fetch task was cancelled")
-                        raise exc
-                    else:
-                        self.logger.error(
-                            f"Unexpected error during emeter fetch: {exc}"
-                        )
+        # Per-device deadlines for the emeter/sysinfo poll
+        self.scheduler = DeviceScheduler(
+            Config.KASA_COLLECTOR_DATA_FETCH_INTERVAL,
+            default_policy=Config.KASA_COLLECTOR_OVERRUN_POLICY,
+            policies=Config.KASA_COLLECTOR_DEVICE_OVERRUN_POLICIES,
+            spread=Config.KASA_COLLECTOR_SPREAD_POLLS,
+        )
 
-            end_time = datetime.now()
-            elapsed = (end_time - start_time).total_seconds()
+        # Devices that keep failing are quarantined and only probed on a
+        # backoff until they respond again
+        self.breaker = CircuitBreaker()
 
-            # Log a summary of the fetch cycle
-            if (
-                elapsed > Config.KASA_COLLECTOR_DATA_FETCH_INTERVAL * 0.8
-            ):  # Log if taking >80% of interval
-                self.logger.warning(
-                    f"Emeter data fetch completed for {device_count} devices "
-                    f"in {elapsed:.2f} seconds (approaching interval limit)."
-                )
-            else:
-                self.logger.debug(
-                    f"Emeter data fetch completed for {device_count} devices "
-                    f"in {elapsed:.2f} seconds."
-                )
+        # Latest sysinfo of devices polled with combined IOT queries, whose
+        # device objects are no longer refreshed by update()
+        self._iot_sysinfo = {}
 
-            if elapsed > Config.KASA_COLLECTOR_DATA_FETCH_INTERVAL:
-                self.logger.warning(
-                    f"Emeter fetch took longer ({elapsed:.2f} seconds) than "
-                    f"the configured interval of "
-                    f"{Config.KASA_COLLECTOR_DATA_FETCH_INTERVAL} seconds."
-                )
+        # Aligned timestamp of each device's last reading, so a catch-up poll
+        # in the same interval doesn't overwrite it in InfluxDB
+        self._last_aligned = {}
 
-            # Calculate the next fetch time and log it
-            next_fetch_time = (
-                datetime.now()
-                + timedelta(
-                    seconds=max(0, Config.KASA_COLLECTOR_DATA_FETCH_INTERVAL - elapsed)
-                )
-            ).strftime("%Y-%m-%d %H:%M:%S")
-            self.logger.debug(f"Next emeter data fetch will run at {next_fetch_time}.")
+        # Component statistics exported with the self-monitoring metrics
+        self.metrics = get_metrics()
+        self.metrics.register_source("write_queue", self.write_queue.stats)
+        if self.storage and self.storage.spool:
+            self.metrics.register_source("spool", self.storage.spool.stats)
+        self.metrics.register_source("circuit_breaker", self.breaker.stats)
+        self.metrics.register_source(
+            "connection_profiles", get_connection_profiles().stats
+        )
+        self.metrics.register_source("dns_cache", get_dns_cache().get_cache_stats)
+        for sink in self.sinks:
+            self.metrics.register_source(f"{sink.name}_sink", sink.stats)
 
-            # Sleep for the remaining time (if any) before the next cycle
-            await asyncio.sleep(
-                max(0, Config.KASA_COLLECTOR_DATA_FETCH_INTERVAL - elapsed)
-            )
+    async def enqueue(self, kind, data, timestamp):
+        """
+        Hand a collected sample to the storage writer, with the time (ns since
+        the epoch) its reading was taken.
+        Only waits when the queue is full and the overflow policy is "block".
+        """
+        await self.write_queue.put({"kind": kind, "data": data, "time": timestamp})
 
-    async def periodic_sysinfo_fetch(self, devices):
+    async def enqueue_many(self, kind, entries, timestamp):
+        """
+        Hand several samples of one reading (e.g. every outlet of a strip) to
+        the storage writer together. entries is a list of {ip: device_data}.
         """
-        Periodically fetch and store system info data from all devices.
-        Runs at the interval defined by the configuration.
+        await self.write_queue.put_many(
+            [{"kind": kind, "data": data, "time": timestamp} for data in entries]
+        )
+
+    async def start_sinks(self):
         """
+        Start every sink and its worker task. Returns the worker tasks.
+        """
+        tasks = []
+        for sink in self.sinks:
+            await sink.start()
+            tasks.append(asyncio.create_task(sink.run()))
+        return tasks
+
+    async def run_storage_writer(self):
+        """
+        Drain the write queue and fan samples out to every sink.
+        Each sink batches, flushes and fails on its own. With the drop_oldest
+        overflow policy a slow sink only falls behind (and eventually drops
+        samples) itself. With block or spill, samples are only taken off the
+        write queue when every sink has room for them, so a stalled sink backs
+        up into the write queue and its overflow policy applies.
+        """
+        backpressure = self.write_queue.overflow_policy != OVERFLOW_DROP_OLDEST
         while True:
-            start_time = datetime.now()
-            device_count = len(devices)
-            self.logger.debug(f"Starting system info fetch for {device_count} devices.")
+            max_items = Config.KASA_COLLECTOR_QUEUE_MAX_SIZE
+            if backpressure and self.sinks:
+                max_items = min(sink.free_slots() for sink in self.sinks)
+                if not max_items:
+                    await asyncio.gather(
+                        *(sink.wait_for_room() for sink in self.sinks)
+                    )
+                    continue
+            items = await self.write_queue.get_batch(
+                max_items=max_items,
+                timeout=SCHEDULE_SYNC_INTERVAL,
+            )
+            for sink in self.sinks:
+                sink.offer(items)
+            await self.write_queue.replay_spilled()
 
+    async def close(self):
+        """
+        Hand any samples still queued to the sinks, then flush and close them.
+        """
+        items = self.write_queue.drain_nowait()
+        for sink in self.sinks:
+            sink.offer(items)
             try:
-                async with asyncio.TaskGroup() as tg:
-                    for ip, device in devices.items():
-                        tg.create_task(self.fetch_and_store_sysinfo(ip, device))
-            except* (ConnectionError, TimeoutError, OSError) as eg:
-                for exc in eg.exceptions:
-                    self.logger.error(f"Network error during sysinfo fetch: {exc}")
-            except* Exception as eg:
-                for exc in eg.exceptions:
-                    if isinstance(exc, asyncio.CancelledError):
-                        self.logger.info("Sysinfo fetch task was cancelled")
-                        raise exc
-                    else:
-                        self.logger.error(
-                            f"Unexpected error during sysinfo fetch: {exc}"
+                await sink.close()
+            except Exception as e:
+                self.logger.error(f"Error closing {sink.name} sink: {e}")
+
+    async def periodic_device_fetch(self, devices):
+        """
+        Poll every device on its own cadence.
+        Each device has its own deadline in the scheduler and is polled in its
+        own task, so a slow or retrying device only delays itself. Emeter data
+        is stored on every poll and sysinfo on every Nth poll of a device.
+        """
+        loop = asyncio.get_running_loop()
+        sysinfo_every = self.sysinfo_tick_interval()
+        self.logger.debug(
+            f"Sysinfo will be stored every {sysinfo_every} emeter fetch cycle(s)."
+        )
+        wakeup = asyncio.Event()
+        running = set()
+
+        try:
+            while True:
+                now = loop.time()
+                self._sync_schedule(devices, now)
+
+                for entry in self.scheduler.pop_due(now):
+                    task = asyncio.create_task(
+                        self._poll_scheduled_device(
+                            entry, devices, sysinfo_every, wakeup
                         )
+                    )
+                    running.add(task)
+                    task.add_done_callback(running.discard)
 
-            end_time = datetime.now()
-            elapsed = (end_time - start_time).total_seconds()
+                # Sleep until the next deadline, a finished poll reschedules a
+                # device, or it's time to look for newly added devices
+                wakeup.clear()
+                timeout = self.scheduler.seconds_until_next(loop.time())
+                if timeout is None or timeout > SCHEDULE_SYNC_INTERVAL:
+                    timeout = SCHEDULE_SYNC_INTERVAL
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            self.logger.info("Device fetch task was cancelled")
+            for task in running:
+                task.cancel()
+            raise
 
-            # Log a summary of the fetch cycle
-            if (
-                elapsed > Config.KASA_COLLECTOR_SYSINFO_FETCH_INTERVAL * 0.8
-            ):  # Log if taking >80% of interval
+    def _sync_schedule(self, devices, now):
+        """
+        Add newly managed devices to the scheduler and drop removed and
+        quarantined ones.
+        """
+        for ip in devices:
+            if ip not in self.scheduler and not self.breaker.is_quarantined(ip):
+                self.scheduler.add(ip, self.scheduler.first_run(ip, now))
+                self.logger.debug(f"Scheduled device {ip} for polling")
+        for ip in self.scheduler.keys():
+            if ip not in devices:
+                self.scheduler.remove(ip)
+                self.breaker.forget(ip)
+                self._last_aligned.pop(ip, None)
+                if self.exporter:
+                    self.exporter.forget(ip)
+                self.logger.debug(f"Removed device {ip} from polling schedule")
+            elif self.breaker.is_quarantined(ip):
+                self.scheduler.remove(ip)
+                self.logger.debug(f"Suspended polling of quarantined device {ip}")
+
+    def _already_sampled(self, ip):
+        """
+        Return True if timestamps are aligned and the device already has a
+        reading stamped with the current interval. Another one, such as a
+        catch_up poll run back-to-back, would get the same timestamp and
+        overwrite it.
+        """
+        return (
+            Config.KASA_COLLECTOR_ALIGN_TIMESTAMPS
+            and self._last_aligned.get(ip) == sample_timestamp()
+        )
+
+    async def _poll_scheduled_device(self, entry, devices, sysinfo_every, wakeup):
+        """
+        Poll a single device for its scheduled slot and reschedule it.
+        """
+        loop = asyncio.get_running_loop()
+        ip = entry.key
+        start_time = loop.time()
+        try:
+            device = devices.get(ip)
+            if device is not None and self._already_sampled(ip):
+                self.metrics.increment("aligned_polls_skipped")
+                self.logger.debug(
+                    f"Skipping poll of {ip}, it already has a reading for "
+                    f"this interval"
+                )
+            elif device is not None:
+                await self.fetch_and_store_device_data(
+                    ip, device, entry.ticks % sysinfo_every == 0
+                )
+                self.breaker.record_success(ip)
+                if Config.KASA_COLLECTOR_ALIGN_TIMESTAMPS:
+                    self._last_aligned[ip] = sample_timestamp()
+        except Exception as e:
+            self.logger.error(f"Error during device fetch for {ip}: {e}")
+            self.breaker.record_failure(ip)
+        finally:
+            now = loop.time()
+            elapsed = now - start_time
+            if elapsed > entry.interval:
                 self.logger.warning(
-                    f"System info fetch completed for {device_count} devices "
-                    f"in {elapsed:.2f} seconds (approaching interval limit)."
+                    f"Device fetch for {ip} took longer ({elapsed:.2f} seconds) "
+                    f"than the configured interval of {entry.interval} seconds."
                 )
             else:
                 self.logger.debug(
-                    f"System info fetch completed for {device_count} devices "
-                    f"in {elapsed:.2f} seconds."
+                    f"Device fetch for {ip} completed in {elapsed:.2f} seconds."
                 )
+            self.scheduler.complete(entry, now)
+            wakeup.set()
 
-            if elapsed > Config.KASA_COLLECTOR_SYSINFO_FETCH_INTERVAL:
-                self.logger.warning(
-                    f"System info fetch took longer ({elapsed:.2f} seconds) than "
-                    f"the configured interval of "
-                    f"{Config.KASA_COLLECTOR_SYSINFO_FETCH_INTERVAL} seconds."
-                )
+    async def run_quarantine_probes(self, devices):
+        """
+        Probe quarantined devices outside the poll schedule.
+        Each probe is a single update() with no retries. A device that
+        responds is released and rejoins the schedule at its next phase.
+        """
+        while True:
+            probes = {}
+            for ip in self.breaker.due_probes():
+                if ip in devices:
+                    probes[ip] = self.probe_device(ip, devices[ip])
+                else:
+                    self.breaker.forget(ip)
+            if probes:
+                results = await asyncio.gather(*probes.values())
+                for ip, responded in zip(probes, results):
+                    self.breaker.record_probe(ip, responded)
 
-            # Calculate the next fetch time and log it
-            next_fetch_time = (
-                datetime.now()
-                + timedelta(
-                    seconds=max(
-                        0, Config.KASA_COLLECTOR_SYSINFO_FETCH_INTERVAL - elapsed
-                    )
-                )
-            ).strftime("%Y-%m-%d %H:%M:%S")
-            self.logger.debug(f"Next system info fetch will run at {next_fetch_time}.")
+            delay = self.breaker.seconds_until_next_probe()
+            if delay is None or delay > SCHEDULE_SYNC_INTERVAL:
+                delay = SCHEDULE_SYNC_INTERVAL
+            await asyncio.sleep(delay)
 
-            # Sleep for the remaining time (if any) before the next cycle
-            await asyncio.sleep(
-                max(0, Config.KASA_COLLECTOR_SYSINFO_FETCH_INTERVAL - elapsed)
+    @limit_concurrency
+    async def probe_device(self, ip, device):
+        """
+        Return True if the device answers a single update().
+        """
+        try:
+            await asyncio.wait_for(
+                device.update(), timeout=Config.KASA_COLLECTOR_AUTH_TIMEOUT
             )
+            return True
+        except Exception as e:
+            self.logger.debug(f"Probe of quarantined device {ip} failed: {e}")
+            return False
+
+    @staticmethod
+    def sysinfo_tick_interval():
+        """
+        Return how many emeter fetch cycles pass between sysinfo samples.
+        The sysinfo interval is rounded to the nearest multiple of the data
+        fetch interval, with a minimum of one cycle.
+        """
+        return max(
+            1,
+            round(
+                Config.KASA_COLLECTOR_SYSINFO_FETCH_INTERVAL
+                / Config.KASA_COLLECTOR_DATA_FETCH_INTERVAL
+            ),
+        )
 
-    @async_retry(operation_name="emeter data fetch")
-    async def fetch_and_store_emeter_data(self, ip, device):
+    @async_retry(operation_name="device data fetch")
+    @limit_concurrency
+    async def fetch_and_store_device_data(self, ip, device, include_sysinfo=False):
         """
-        Fetch and store emeter data for a specific device with automatic retry handling.
+        Fetch device data and store the emeter data and, when requested, the
+        sysinfo data. Sysinfo cycles double as the periodic full update(); other
+        cycles only query the realtime energy module when the fast path is on.
+        Legacy IOT devices are read with combined requests instead when that
+        poll mode is on.
+        Every sample of a fetch is stamped with the time its reading returned.
         """
-        async with DeviceContext(device, ip, "emeter fetch"):
-            await device.update()
-            if isinstance(device, SmartStrip):
-                await self.process_smart_strip_data(ip, device)
+        async with DeviceContext(device, ip, "device fetch") as ctx:
+            if (
+                Config.KASA_COLLECTOR_IOT_COMBINED_QUERY
+                and KasaAPI.supports_combined_query(device)
+            ):
+                await self.fetch_iot_combined(ip, device, ctx, include_sysinfo)
+            elif include_sysinfo or not Config.KASA_COLLECTOR_EMETER_FAST_PATH:
+                with self.metrics.timer("device_update_seconds"):
+                    await device.update()
+                timestamp = sample_timestamp()
+                # Store sysinfo first so emeter points can pick up the device_id
+                if include_sysinfo:
+                    await self.store_sysinfo(ip, device, ctx, timestamp)
+                if isinstance(device, SmartStrip):
+                    await self.process_smart_strip_data(ip, device, timestamp)
+                elif device.has_emeter:
+                    await self.process_device_data(ip, device, timestamp)
+            elif isinstance(device, SmartStrip):
+                with self.metrics.timer("emeter_query_seconds"):
+                    strip_emeter, child_emeters = (
+                        await KasaAPI.fetch_strip_emeter_realtime(device)
+                    )
+                await self.process_smart_strip_data(
+                    ip, device, sample_timestamp(), strip_emeter, child_emeters
+                )
             elif device.has_emeter:
-                await self.process_device_data(ip, device)
+                with self.metrics.timer("emeter_query_seconds"):
+                    emeter = await KasaAPI.fetch_emeter_realtime(device)
+                await self.process_device_data(ip, device, sample_timestamp(), emeter)
 
-    async def process_smart_strip_data(self, ip, smart_strip):
+    async def fetch_iot_combined(self, ip, device, ctx, include_sysinfo):
+        """
+        Read an IOT plug or strip with combined module requests and store its
+        samples. Plugs return sysinfo with every reading at no extra cost;
+        strips only fetch it on sysinfo cycles. Device and outlet names come
+        from the most recent sysinfo.
+        """
+        is_strip = isinstance(device, SmartStrip)
+        with self.metrics.timer("combined_query_seconds"):
+            sys_info, emeter, child_emeters = await KasaAPI.fetch_iot_combined(
+                device, include_sysinfo=include_sysinfo or not is_strip
+            )
+        timestamp = sample_timestamp()
+        if sys_info is not None:
+            self._iot_sysinfo[ip] = sys_info
+        sys_info = self._iot_sysinfo.get(ip)
+
+        # Store sysinfo first so emeter points can pick up the device_id
+        if include_sysinfo:
+            await self.store_sysinfo(ip, device, ctx, timestamp, sys_info)
+        if is_strip:
+            await self.process_smart_strip_data(
+                ip, device, timestamp, emeter, child_emeters, sys_info
+            )
+        else:
+            await self.process_device_data(ip, device, timestamp, emeter, sys_info)
+
+    async def process_smart_strip_data(
+        self,
+        ip,
+        smart_strip,
+        timestamp,
+        strip_emeter=None,
+        child_emeters=None,
+        sys_info=None,
+    ):
         """
         Process emeter data for a smart strip and its child plugs.
         Stores the data in InfluxDB for the strip and each child plug.
+        Readings from the emeter fast path are used when provided, otherwise
+        the values from the last update() are read from the device; the
+        strip's update() already refreshes its children. The strip and all of
+        its outlets are queued as one batch.
+        Names are read from sys_info when it is given.
         """
         try:
+            if strip_emeter is None:
+                strip_emeter = smart_strip.emeter_realtime
             smart_strip_emeter_data = {
-                key: int(value) for key, value in smart_strip.emeter_realtime.items()
+                key: int(value) for key, value in strip_emeter.items()
             }
+            strip_alias = smart_strip.alias
+            child_aliases = {}
+            if sys_info:
+                strip_alias = sys_info.get("alias") or strip_alias
+                child_aliases = {
+                    child.get("id"): child.get("alias")
+                    for child in sys_info.get("children", [])
+                }
+            hostname = get_hostname_nowait(ip)
             smart_strip_data = {
                 "emeter": smart_strip_emeter_data,
-                "alias": smart_strip.alias,
-                "dns_name": await get_hostname_cached(ip),
+                "alias": strip_alias,
+                "dns_name": hostname,
                 "ip": ip,
                 "equipment_type": "device",
             }
-            self.logger.debug(
-                f"Storing smart strip data for {smart_strip.alias} (IP: {ip})."
-            )
-            await self.storage.process_emeter_data({ip: smart_strip_data})
+            samples = [{ip: smart_strip_data}]
 
-            for child in smart_strip.children:
-                await child.update()
-                plug_alias = f"{child.alias}"
+            for index, child in enumerate(smart_strip.children):
+                if child_emeters is None:
+                    child_emeter = child.emeter_realtime
+                else:
+                    child_emeter = child_emeters[index]
+                child_alias = child_aliases.get(getattr(child, "child_id", None))
+                plug_alias = f"{child_alias or child.alias}"
                 child_emeter_data = {
-                    key: int(value) for key, value in child.emeter_realtime.items()
+                    key: int(value) for key, value in child_emeter.items()
                 }
                 child_data = {
                     "emeter": child_emeter_data,
-                    "alias": smart_strip.alias,
+                    "alias": strip_alias,
                     "plug_alias": plug_alias,
-                    "dns_name": await get_hostname_cached(ip),
+                    "dns_name": hostname,
                     "ip": ip,
                     "equipment_type": "plug",
                 }
-                self.logger.debug(
-                    f"Storing child plug data for {plug_alias} (IP: {ip})."
-                )
-                await self.storage.process_emeter_data({ip: child_data})
+                samples.append({ip: child_data})
+
+            self.logger.debug(
+                f"Storing smart strip data for {strip_alias} "
+                f"and {len(samples) - 1} plugs (IP: {ip})."
+            )
+            await self.enqueue_many("emeter", samples, timestamp)
         except Exception as e:
             self.logger.error(f"Error processing smart strip data for {ip}: {e}")
 
-    async def process_device_data(self, ip, device):
+    async def process_device_data(
+        self, ip, device, timestamp, emeter=None, sys_info=None
+    ):
         """
         Process emeter data for a device and store it in InfluxDB.
+        Uses the fast path reading when provided, otherwise the last update().
+        The alias is read from sys_info when it is given.
         """
         try:
-            emeter_data = {
-                key: int(value) for key, value in device.emeter_realtime.items()
-            }
-            device_alias = device.alias if device.alias else device.host
+            if emeter is None:
+                emeter = device.emeter_realtime
+            emeter_data = {key: int(value) for key, value in emeter.items()}
+            device_alias = (sys_info or {}).get("alias") or device.alias or device.host
             device_data = {
                 "emeter": emeter_data,
                 "alias": device_alias,
-                "dns_name": await get_hostname_cached(ip),
+                "dns_name": get_hostname_nowait(ip),
                 "ip": ip,
                 "equipment_type": "device",
             }
             self.logger.debug(f"Storing emeter data for {device_alias} (IP: {ip}).")
-            await self.storage.process_emeter_data({ip: device_data})
+            await self.enqueue("emeter", {ip: device_data}, timestamp)
         except (AttributeError, KeyError, ValueError, TypeError) as e:
             self.logger.error(f"Data processing error for emeter data at {ip}: {e}")
         except Exception as e:
             self.logger.error(f"Unexpected error processing emeter data for {ip}: {e}")
 
-    @async_retry(operation_name="sysinfo fetch")
-    async def fetch_and_store_sysinfo(self, ip, device):
+    async def store_sysinfo(self, ip, device, ctx, timestamp, sys_info=None):
         """
-        Fetch and store system info data for a device with automatic retry handling.
+        Store system info data for a device from its most recent update(), or
+        the sys_info read by a combined query.
         """
-        async with DeviceContext(device, ip, "sysinfo fetch") as ctx:
-            await device.update()
-            self.logger.debug(f"Fetched sysinfo for device {ip}: {device.sys_info}")
-            sysinfo_data = {
-                "sysinfo": device.sys_info,
-                "device_alias": ctx.device_name,
-                "dns_name": ctx.hostname,
-                "ip": ip,
-                "equipment_type": "device",
-            }
-            self.logger.debug(f"Storing sysinfo data for {ctx.device_name} (IP: {ip})")
-            await self.storage.process_sysinfo_data({ip: sysinfo_data})
+        device_alias = ctx.device_name
+        if sys_info is None:
+            sys_info = device.sys_info
+        else:
+            device_alias = sys_info.get("alias") or device_alias
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Fetched sysinfo for device {ip}: {sys_info}")
+        sysinfo_data = {
+            "sysinfo": sys_info,
+            "device_alias": device_alias,
+            "dns_name": ctx.hostname,
+            "ip": ip,
+            "equipment_type": "device",
+        }
+        self.logger.debug(f"Storing sysinfo data for {device_alias} (IP: {ip})")
+        await self.enqueue("sysinfo", {ip: sysinfo_data}, timestamp)
@@ -0,0 +1,175 @@
+"""
+Prometheus pull exporter for device readings.
+Keeps the latest emeter and sysinfo values of every device in memory and
+serves them in the Prometheus text format, so a scrape never touches a device.
+"""
+
+import logging
+import time
+from typing import Any
+
+from config import Config
+from sinks import Sink, Sample
+
+type SeriesKey = tuple[str, str | None]  # (ip, plug_alias)
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "kasa"
+
+# Readings are cheap to apply, so take large batches with little delay
+EXPORTER_BATCH_SIZE = 1000
+EXPORTER_FLUSH_INTERVAL = 1
+
+# A series stops being exported once this many of its fetch intervals pass
+# without a new reading, so a device that stopped answering or was
+# quarantined doesn't look like it is still drawing power
+STALE_INTERVALS = 3
+
+
+def _escape_label(value: Any) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def _metric_name(name: str) -> str:
+    """Turn a sysinfo/emeter key into a valid metric name component."""
+    return "".join(c if c.isalnum() else "_" for c in name).lower()
+
+
+def _numeric(value: Any):
+    """Return the value as a number, or None if it isn't one."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+
+class PrometheusExporter(Sink):
+    """
+    In-memory snapshot of the latest device readings.
+
+    Each sample replaces the previous reading of its series. Rendered output
+    is cached and only rebuilt after new samples arrive or a series goes
+    stale, so scrape cost does not depend on how often devices are polled.
+    """
+
+    name = "prometheus"
+
+    def __init__(self):
+        super().__init__(
+            batch_size=EXPORTER_BATCH_SIZE, flush_interval=EXPORTER_FLUSH_INTERVAL
+        )
+        # metric name -> (ip, plug_alias) -> (pre-rendered sample line,
+        # monotonic time it goes stale)
+        self._families: dict[str, dict[SeriesKey, tuple[str, float]]] = {}
+        self._rendered = ""
+        self._dirty = False
+        self._next_expiry = float("inf")
+
+    def _set(self, metric: str, labels: dict[str, Any], value, max_age: float):
+        # Series are keyed by device and outlet, so a renamed device replaces
+        # its old series instead of leaving a stale one behind
+        key = (labels["ip"], labels.get("plug_alias"))
+        label_text = ",".join(
+            f'{k}="{_escape_label(v)}"'
+            for k, v in sorted(labels.items())
+            if v is not None
+        )
+        line = f"{metric}{{{label_text}}} {value}"
+        expires_at = time.monotonic() + max_age
+        self._families.setdefault(metric, {})[key] = (line, expires_at)
+        self._next_expiry = min(self._next_expiry, expires_at)
+        self._dirty = True
+
+    async def write(self, samples: list[Sample]):
+        for sample in samples:
+            if sample["kind"] == "sysinfo":
+                await self.process_sysinfo_data(sample["data"])
+            else:
+                await self.process_emeter_data(sample["data"])
+
+    async def process_emeter_data(self, device_data):
+        """
+        Record the latest emeter readings of a device or strip outlet.
+        """
+        max_age = STALE_INTERVALS * Config.KASA_COLLECTOR_DATA_FETCH_INTERVAL
+        for ip, data in device_data.items():
+            labels = {
+                "ip": ip,
+                "dns_name": data.get("dns_name"),
+                "device_alias": data.get("alias"),
+                "plug_alias": data.get("plug_alias"),
+                "equipment_type": data.get("equipment_type", "device"),
+            }
+            for field, value in data.get("emeter", {}).items():
+                value = _numeric(value)
+                if value is not None:
+                    self._set(
+                        f"{METRIC_PREFIX}_emeter_{_metric_name(field)}",
+                        labels,
+                        value,
+                        max_age,
+                    )
+
+    async def process_sysinfo_data(self, device_data):
+        """
+        Record the latest numeric sysinfo values of a device.
+        """
+        max_age = STALE_INTERVALS * Config.KASA_COLLECTOR_SYSINFO_FETCH_INTERVAL
+        for ip, data in device_data.items():
+            labels = {
+                "ip": ip,
+                "dns_name": data.get("dns_name"),
+                "device_alias": data.get("device_alias") or data.get("alias") or ip,
+            }
+            for field, value in data.get("sysinfo", {}).items():
+                value = _numeric(value)
+                if value is not None:
+                    self._set(
+                        f"{METRIC_PREFIX}_sysinfo_{_metric_name(field)}",
+                        labels,
+                        value,
+                        max_age,
+                    )
+
+    def forget(self, ip: str):
+        """Drop every series of a device that is no longer managed."""
+        for series in self._families.values():
+            for key in [key for key in series if key[0] == ip]:
+                del series[key]
+                self._dirty = True
+
+    def _drop_stale(self):
+        """Drop series that have had no reading for too long."""
+        now = time.monotonic()
+        if now < self._next_expiry:
+            return
+        next_expiry = float("inf")
+        for series in self._families.values():
+            for key, (_, expires_at) in list(series.items()):
+                if expires_at <= now:
+                    del series[key]
+                    self._dirty = True
+                else:
+                    next_expiry = min(next_expiry, expires_at)
+        self._next_expiry = next_expiry
+
+    def render(self) -> str:
+        """
+        Return the latest readings in the Prometheus text format.
+        """
+        self._drop_stale()
+        if self._dirty:
+            lines = []
+            for metric, series in sorted(self._families.items()):
+                if not series:
+                    continue
+                lines.append(f"# TYPE {metric} gauge")
+                lines.extend(line for line, _ in series.values())
+            self._rendered = "\n".join(lines) + "\n" if lines else ""
+            self._dirty = False
+        return self._rendered
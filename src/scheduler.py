@@ -0,0 +1,166 @@
+"""
+Per-device poll scheduler.
+Tracks each device's next deadline in a heap on the event loop's monotonic
+clock so every device keeps its own cadence.
+"""
+
+import heapq
+import itertools
+import logging
+import zlib
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+OVERRUN_SKIP = "skip"
+OVERRUN_CATCH_UP = "catch_up"
+OVERRUN_POLICIES = {OVERRUN_SKIP, OVERRUN_CATCH_UP}
+
+# Catch-up never runs more than this many missed slots back-to-back
+MAX_CATCH_UP_SLOTS = 3
+
+
+class ScheduleEntry:
+    """
+    Scheduling state for a single device.
+    """
+
+    __slots__ = ("key", "interval", "policy", "next_run", "ticks", "running")
+
+    def __init__(self, key: str, interval: float, policy: str, next_run: float):
+        self.key = key
+        self.interval = interval
+        self.policy = policy
+        self.next_run = next_run
+        self.ticks = 0  # Completed polls, used for every-Nth-tick work
+        self.running = False
+
+
+class DeviceScheduler:
+    """
+    Heap of per-device deadlines.
+
+    Devices are popped when their deadline passes and pushed back with their
+    next deadline once their poll completes, so a slow or retrying device
+    only delays itself. What happens when a poll overruns its interval is set
+    per device:
+    - skip: missed slots are dropped and the device resumes on its cadence
+    - catch_up: missed slots are polled back-to-back (up to
+      MAX_CATCH_UP_SLOTS) before the device returns to its cadence
+
+    With spread enabled, each device gets a fixed phase within the interval
+    derived from its key, so polls are spread evenly across the interval
+    rather than all firing at the same instant.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        default_policy: str = OVERRUN_SKIP,
+        policies: Optional[dict[str, str]] = None,
+        spread: bool = True,
+    ):
+        self.interval = interval
+        self.spread = spread
+        self.default_policy = default_policy
+        self.policies = policies or {}
+        self._entries: dict[str, ScheduleEntry] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._counter = itertools.count()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def keys(self) -> list[str]:
+        """Return the keys of all scheduled devices."""
+        return list(self._entries)
+
+    def phase_offset(self, key: str) -> float:
+        """
+        Return the device's fixed offset within the interval.
+        Uses crc32 rather than hash() so the offset is the same across restarts.
+        """
+        return zlib.crc32(key.encode()) / 2**32 * self.interval
+
+    def first_run(self, key: str, now: float) -> float:
+        """
+        Return when a newly added device should first be polled: the next
+        occurrence of its phase, or now if spreading is disabled.
+        """
+        if not self.spread:
+            return now
+        return now + (self.phase_offset(key) - now) % self.interval
+
+    def add(self, key: str, first_run: float) -> ScheduleEntry:
+        """Schedule a device for its first poll at first_run."""
+        entry = ScheduleEntry(
+            key,
+            self.interval,
+            self.policies.get(key, self.default_policy),
+            first_run,
+        )
+        self._entries[key] = entry
+        self._push(entry)
+        return entry
+
+    def remove(self, key: str):
+        """Stop scheduling a device. Its heap slot is discarded lazily."""
+        self._entries.pop(key, None)
+
+    def _push(self, entry: ScheduleEntry):
+        heapq.heappush(self._heap, (entry.next_run, next(self._counter), entry.key))
+
+    def pop_due(self, now: float) -> list[ScheduleEntry]:
+        """
+        Remove and return every device whose deadline has passed.
+        Returned entries are marked running until complete() is called.
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            # Skip stale slots of removed or rescheduled devices
+            if entry is None or entry.running or entry.next_run != deadline:
+                continue
+            entry.running = True
+            due.append(entry)
+        return due
+
+    def complete(self, entry: ScheduleEntry, now: float):
+        """
+        Reschedule a device after its poll finished at time now, applying
+        its overrun policy if the poll ran past the next deadline.
+        """
+        entry.running = False
+        entry.ticks += 1
+        if self._entries.get(entry.key) is not entry:
+            return
+
+        next_run = entry.next_run + entry.interval
+        if next_run <= now:
+            missed = int((now - entry.next_run) // entry.interval)
+            if entry.policy == OVERRUN_CATCH_UP and missed <= MAX_CATCH_UP_SLOTS:
+                logger.debug(
+                    f"Device {entry.key} overran by {missed} slot(s), catching up"
+                )
+            else:
+                # Jump to the first slot still in the future
+                next_run = entry.next_run + (missed + 1) * entry.interval
+                logger.debug(
+                    f"Device {entry.key} overran its interval, "
+                    f"skipping {missed} slot(s)"
+                )
+
+        entry.next_run = next_run
+        self._push(entry)
+
+    def seconds_until_next(self, now: float) -> Optional[float]:
+        """Return seconds until the earliest deadline, or None if idle."""
+        while self._heap:
+            deadline, _, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is None or entry.running or entry.next_run != deadline:
+                heapq.heappop(self._heap)
+                continue
+            return max(0.0, deadline - now)
+        return None
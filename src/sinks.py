@@ -0,0 +1,170 @@
+"""
+Pluggable sinks for collected samples.
+Every sink has its own bounded queue and worker task, so one collection pass
+fans out to all sinks and a slow or failing sink never holds up the others.
+"""
+
+import asyncio
+import logging
+from typing import Any, Optional
+
+from config import Config
+from metrics import get_metrics
+
+type Sample = dict[str, Any]  # {"kind": "emeter" | "sysinfo", "data": {...}}
+type SinkStats = dict[str, int]
+
+logger = logging.getLogger(__name__)
+
+
+class Sink:
+    """
+    Base class for sample sinks.
+
+    Subclasses implement write() and, if they buffer, flush(). The worker in
+    run() takes every sample already queued (up to max_batch) and waits for
+    more, at most flush_interval seconds after the first one, until it has
+    batch_size, then calls write() and flush(). Samples arrive through
+    offer(); when the sink's queue is full the oldest sample is dropped so a
+    stalled sink cannot back up the collector. Writers that want
+    backpressure instead check free_slots() and wait_for_room() first.
+    """
+
+    name = "sink"
+
+    def __init__(
+        self,
+        batch_size: int = 1,
+        flush_interval: float = 10,
+        queue_size: Optional[int] = None,
+        max_batch: Optional[int] = None,
+    ):
+        if queue_size is None:
+            queue_size = Config.KASA_COLLECTOR_QUEUE_MAX_SIZE
+        if max_batch is None:
+            max_batch = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.max_batch = max(max_batch, batch_size)
+        self._queue: asyncio.Queue[Sample] = asyncio.Queue(maxsize=queue_size)
+        self._room = asyncio.Event()
+
+        # Counters exported through stats()
+        self.received = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+    async def start(self):
+        """Prepare the sink before the first write."""
+
+    async def write(self, samples: list[Sample]):
+        """Store a batch of samples."""
+        raise NotImplementedError
+
+    async def flush(self):
+        """Push out anything buffered by write()."""
+
+    async def periodic(self):
+        """Called after every batch and idle timeout, for housekeeping."""
+
+    async def close(self):
+        """Write whatever is still queued, then flush."""
+        samples = []
+        while not self._queue.empty():
+            samples.append(self._queue.get_nowait())
+        await self._write_batch(samples)
+        await self.flush()
+
+    def offer(self, samples: list[Sample]):
+        """Queue samples for this sink without waiting."""
+        for sample in samples:
+            if self._queue.full():
+                self._queue.get_nowait()
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning(
+                        f"{self.name} sink is falling behind, "
+                        f"dropped {self.dropped} oldest samples so far"
+                    )
+            self._queue.put_nowait(sample)
+            self.received += 1
+
+    def free_slots(self) -> int:
+        """Return how many samples can be offered without dropping any."""
+        return self.queue_size - self._queue.qsize()
+
+    async def wait_for_room(self):
+        """Wait until the worker has taken samples off a full queue."""
+        while not self.free_slots():
+            self._room.clear()
+            await self._room.wait()
+
+    async def _next_batch(self) -> list[Sample]:
+        """Collect the next batch, or return an empty list after an idle timeout."""
+        loop = asyncio.get_running_loop()
+        try:
+            first = await asyncio.wait_for(
+                self._queue.get(), timeout=self.flush_interval
+            )
+        except asyncio.TimeoutError:
+            return []
+
+        batch = [first]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                # Everything already waiting goes into this batch
+                batch.append(self._queue.get_nowait())
+                continue
+            if len(batch) >= self.batch_size:
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                )
+            except asyncio.TimeoutError:
+                break
+        self._room.set()
+        return batch
+
+    async def _write_batch(self, samples: list[Sample]):
+        """Write a batch, keeping failures inside this sink."""
+        if not samples:
+            return
+        try:
+            with get_metrics().timer(f"{self.name}_sink_write_seconds"):
+                await self.write(samples)
+            self.written += len(samples)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error writing {len(samples)} samples to {self.name}: {e}")
+
+    async def run(self):
+        """
+        Worker loop: write batches as they fill up or time out.
+        """
+        while True:
+            await self._write_batch(await self._next_batch())
+            try:
+                await self.flush()
+                await self.periodic()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error flushing {self.name} sink: {e}")
+
+    def stats(self) -> SinkStats:
+        """
+        Get sink statistics for export as self-monitoring metrics.
+        """
+        return {
+            "depth": self._queue.qsize(),
+            "received": self.received,
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
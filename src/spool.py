@@ -0,0 +1,237 @@
+"""
+Disk-backed write-ahead spool for InfluxDB outages.
+Stores line protocol in append-only segment files and hands it back, oldest
+first, for replay once the sink recovers.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+import aiofiles
+from config import Config
+
+type SpoolStats = dict[str, int]
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".lp"
+# Records InfluxDB refused, kept for inspection instead of being replayed
+REJECTED_FILE = "rejected.lp"
+
+
+class Spool:
+    """
+    Append-only, segment-based spool of line protocol records.
+
+    Batches are appended to the active segment until it reaches the segment
+    size, then a new segment is started. Replay reads the oldest segment in
+    order and deletes it once every line has been committed. Segments are
+    discarded oldest first when the spool exceeds its size or age cap.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        segment_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        max_age: Optional[int] = None,
+    ):
+        if directory is None:
+            directory = os.path.join(Config.KASA_COLLECTOR_SPOOL_DIR, "influxdb")
+        if segment_size is None:
+            segment_size = Config.KASA_COLLECTOR_SPOOL_SEGMENT_SIZE_MB * 1024 * 1024
+        if max_size is None:
+            max_size = Config.KASA_COLLECTOR_SPOOL_MAX_SIZE_MB * 1024 * 1024
+        if max_age is None:
+            max_age = Config.KASA_COLLECTOR_SPOOL_MAX_AGE
+
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self._lock = asyncio.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._segments = sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        self._next_sequence = (
+            self._sequence_of(self._segments[-1]) + 1 if self._segments else 1
+        )
+        self._size = sum(self._file_size(path) for path in self._segments)
+        # New appends always go to a fresh segment after a restart
+        self._active: Optional[str] = None
+
+        # Replay state for the oldest segment
+        self._replay_lines: Optional[list[str]] = None
+        self._replay_offset = 0
+
+        # Counters exported through stats()
+        self.appended = 0
+        self.replayed = 0
+        self.discarded_segments = 0
+        self.quarantined = 0
+
+        if self._segments:
+            logger.info(
+                f"Found {len(self._segments)} spooled segments "
+                f"({self._size} bytes) in {self.directory}"
+            )
+
+    @staticmethod
+    def _sequence_of(path: str) -> int:
+        name = os.path.basename(path)
+        return int(name[len(SEGMENT_PREFIX) : -len(SEGMENT_SUFFIX)])
+
+    @staticmethod
+    def _file_size(path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def is_empty(self) -> bool:
+        """Return True if there is nothing waiting for replay."""
+        return not self._segments
+
+    async def append(self, lines: list[str]):
+        """
+        Append a batch of line protocol records to the active segment.
+        """
+        if not lines:
+            return
+        data = "\n".join(lines) + "\n"
+
+        async with self._lock:
+            if self._active is None or (
+                self._file_size(self._active) >= self.segment_size
+            ):
+                self._active = os.path.join(
+                    self.directory,
+                    f"{SEGMENT_PREFIX}{self._next_sequence:010d}{SEGMENT_SUFFIX}",
+                )
+                self._next_sequence += 1
+                self._segments.append(self._active)
+
+            async with aiofiles.open(self._active, "a") as f:
+                await f.write(data)
+            self._size += len(data.encode())
+            self.appended += len(lines)
+
+        await self.enforce_limits()
+
+    async def read_batch(self, max_lines: int) -> list[str]:
+        """
+        Return up to max_lines records from the oldest segment, starting after
+        the last committed record. Call commit() once the batch is written.
+        """
+        async with self._lock:
+            if not self._segments:
+                return []
+
+            oldest = self._segments[0]
+            if oldest == self._active:
+                # Seal the active segment so replay never races with appends
+                self._active = None
+
+            if self._replay_lines is None:
+                try:
+                    async with aiofiles.open(oldest, "r") as f:
+                        self._replay_lines = [
+                            line.rstrip("\n") for line in await f.readlines() if line
+                        ]
+                except FileNotFoundError:
+                    self._replay_lines = []
+                self._replay_offset = 0
+
+            return self._replay_lines[
+                self._replay_offset : self._replay_offset + max_lines
+            ]
+
+    async def commit(self, count: int):
+        """
+        Mark records returned by read_batch() as written. The oldest segment is
+        deleted once all of its records are committed.
+        """
+        async with self._lock:
+            if self._replay_lines is None:
+                return
+            self._replay_offset += count
+            self.replayed += count
+            if self._replay_offset >= len(self._replay_lines):
+                self._remove_oldest()
+
+    async def quarantine(self, lines: list[str]):
+        """
+        Set aside records InfluxDB will never accept by appending them to the
+        rejected file, which is not replayed. Records are dropped instead
+        once the rejected file reaches the spool size cap.
+        """
+        if not lines:
+            return
+        path = os.path.join(self.directory, REJECTED_FILE)
+        data = "\n".join(lines) + "\n"
+        async with self._lock:
+            self.quarantined += len(lines)
+            if self._file_size(path) + len(data.encode()) > self.max_size:
+                logger.warning(
+                    f"Dropping {len(lines)} rejected records, "
+                    f"{REJECTED_FILE} is at the spool size cap"
+                )
+                return
+            async with aiofiles.open(path, "a") as f:
+                await f.write(data)
+
+    def _remove_oldest(self):
+        """Delete the oldest segment and reset the replay state."""
+        oldest = self._segments.pop(0)
+        self._size -= self._file_size(oldest)
+        try:
+            os.remove(oldest)
+        except FileNotFoundError:
+            pass
+        if oldest == self._active:
+            self._active = None
+        self._replay_lines = None
+        self._replay_offset = 0
+
+    async def enforce_limits(self):
+        """
+        Discard the oldest segments while the spool exceeds its size cap or
+        holds segments that have not been written to within the age cap.
+        """
+        async with self._lock:
+            cutoff = time.time() - self.max_age
+            while self._segments:
+                oldest = self._segments[0]
+                try:
+                    too_old = os.path.getmtime(oldest) < cutoff
+                except OSError:
+                    too_old = True
+                if not too_old and self._size <= self.max_size:
+                    break
+                logger.warning(
+                    f"Discarding spooled segment {os.path.basename(oldest)} "
+                    f"({'older than max age' if too_old else 'spool size cap'})"
+                )
+                self._remove_oldest()
+                self.discarded_segments += 1
+
+    def stats(self) -> SpoolStats:
+        """
+        Get spool statistics for export as self-monitoring metrics.
+        """
+        return {
+            "segments": len(self._segments),
+            "size_bytes": self._size,
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "discarded_segments": self.discarded_segments,
+            "quarantined": self.quarantined,
+        }
@@ -0,0 +1,167 @@
+"""
+Incremental unicast discovery of configured subnets.
+Probes a slice of the configured address space each discovery cycle with
+rate-limited unicast discovery requests, instead of broadcasting, so routed
+VLANs are reachable and the cost of a cycle doesn't grow with subnet size.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from config import Config
+
+type ProbeFunc = Callable[[str], Awaitable[Any]]  # ip -> device or None
+type ScannerStats = dict[str, int]
+
+logger = logging.getLogger(__name__)
+
+
+class SubnetScanner:
+    """
+    Sweeps a list of networks for devices, a slice at a time.
+
+    Each scan probes the next sweep_size addresses of the address space that
+    have never answered, continuing where the previous scan stopped and
+    wrapping around at the end. Addresses that answered before are probed
+    again only once every live_recheck seconds, and addresses of devices that
+    are already managed are skipped entirely. Probes are started at most
+    probe_rate per second, with at most max_probes in flight. That limit is
+    kept apart from the shared request semaphore, since a probe of an empty
+    address holds its slot for the whole discovery timeout and would
+    otherwise crowd out device polls.
+    """
+
+    def __init__(
+        self,
+        networks: Optional[list[ipaddress.IPv4Network]] = None,
+        probe: Optional[ProbeFunc] = None,
+        probe_rate: Optional[int] = None,
+        max_probes: Optional[int] = None,
+        sweep_size: Optional[int] = None,
+        live_recheck: Optional[int] = None,
+        clock=time.monotonic,
+    ):
+        if networks is None:
+            networks = Config.KASA_COLLECTOR_DISCOVERY_SUBNETS
+        if probe_rate is None:
+            probe_rate = Config.KASA_COLLECTOR_DISCOVERY_PROBE_RATE
+        if max_probes is None:
+            max_probes = Config.KASA_COLLECTOR_DISCOVERY_MAX_PROBES
+        if sweep_size is None:
+            sweep_size = Config.KASA_COLLECTOR_DISCOVERY_SWEEP_SIZE
+        if live_recheck is None:
+            live_recheck = Config.KASA_COLLECTOR_DISCOVERY_LIVE_RECHECK_INTERVAL
+
+        self.networks = networks
+        self.probe = probe
+        self.probe_rate = probe_rate
+        self._probe_slots = asyncio.Semaphore(max_probes)
+        self.sweep_size = sweep_size
+        self.live_recheck = live_recheck
+        self._clock = clock
+        self._size = sum(network.num_addresses for network in networks)
+        self._cursor = 0
+        self._live: dict[str, float] = {}  # ip -> last response (clock)
+
+        # Counters exported through stats()
+        self.scans = 0
+        self.probes = 0
+        self.responses = 0
+        self.sweeps = 0
+
+    def _address(self, index: int) -> Optional[str]:
+        """
+        Return the address at index in the combined address space, or None
+        for a network or broadcast address.
+        """
+        for network in self.networks:
+            if index < network.num_addresses:
+                if network.prefixlen < 31 and index in (0, network.num_addresses - 1):
+                    return None
+                return str(network[index])
+            index -= network.num_addresses
+        return None
+
+    def _next_unknown(self, skip: set[str]) -> list[str]:
+        """
+        Advance the sweep cursor past the next sweep_size addresses that
+        have never answered, at most once around the address space.
+        """
+        addresses = []
+        for _ in range(self._size):
+            if len(addresses) >= self.sweep_size:
+                break
+            ip = self._address(self._cursor)
+            self._cursor += 1
+            if self._cursor >= self._size:
+                self._cursor = 0
+                self.sweeps += 1
+            if ip is not None and ip not in skip and ip not in self._live:
+                addresses.append(ip)
+        return addresses
+
+    def _due_live(self, skip: set[str], now: float) -> list[str]:
+        """Return answering addresses due for another probe."""
+        return [
+            ip
+            for ip, last_seen in self._live.items()
+            if ip not in skip and now - last_seen >= self.live_recheck
+        ]
+
+    async def scan(self, known: Iterable[str] = ()) -> dict[str, Any]:
+        """
+        Probe this cycle's addresses and return {ip: device} for every
+        address that answered. known are addresses already being managed.
+        """
+        skip = set(known)
+        now = self._clock()
+        addresses = self._due_live(skip, now) + self._next_unknown(skip)
+        self.scans += 1
+        if not addresses:
+            return {}
+
+        logger.debug(
+            f"Probing {len(addresses)} addresses at up to "
+            f"{self.probe_rate} per second"
+        )
+        tasks = []
+        for ip in addresses:
+            tasks.append(asyncio.create_task(self._probe(ip)))
+            await asyncio.sleep(1 / self.probe_rate)
+        results = await asyncio.gather(*tasks)
+
+        found = {}
+        now = self._clock()
+        for ip, device in zip(addresses, results):
+            if device is not None:
+                found[ip] = device
+                self._live[ip] = now
+            else:
+                # A device that stopped answering goes back to the sweep
+                self._live.pop(ip, None)
+        self.responses += len(found)
+        logger.debug(f"{len(found)} of {len(addresses)} probed addresses answered")
+        return found
+
+    async def _probe(self, ip: str):
+        async with self._probe_slots:
+            self.probes += 1
+            try:
+                return await self.probe(ip)
+            except Exception as e:
+                logger.debug(f"No discovery response from {ip}: {e}")
+                return None
+
+    def stats(self) -> ScannerStats:
+        return {
+            "addresses": self._size,
+            "live_addresses": len(self._live),
+            "cursor": self._cursor,
+            "scans": self.scans,
+            "probes": self.probes,
+            "responses": self.responses,
+            "sweeps": self.sweeps,
+        }
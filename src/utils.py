@@ -5,10 +5,13 @@ Includes retry decorators, device helpers, and Python 3.13 modern patterns.
 
 import asyncio
 import logging
+import time
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 from typing import Callable, Any, Optional, TypeVar, ParamSpec, Coroutine
-from dns_cache import get_hostname_cached
+from dns_cache import get_hostname_nowait
 from config import Config
+from metrics import get_metrics
 
 # Modern Python 3.13 type hints
 P = ParamSpec("P")
@@ -35,6 +38,22 @@ def get_device_name(device) -> str:
         return "Unknown Device"
 
 
+def _describe_device_call(args) -> str:
+    """
+    Describe the device a retried call is about, for log messages.
+    Assumes the (self, ip, device) argument pattern.
+    """
+    if len(args) < 3:
+        return ""
+    try:
+        ip = str(args[1])
+        device_name = get_device_name(args[2])
+        hostname = get_hostname_nowait(ip)
+        return f" for {device_name} (IP: {ip}, Hostname: {hostname})"
+    except Exception:
+        return f" for device at {args[1]}"
+
+
 def async_retry(
     max_retries: int = Config.KASA_COLLECTOR_FETCH_MAX_RETRIES,
     base_delay: float = Config.KASA_COLLECTOR_FETCH_RETRY_DELAY,
@@ -64,42 +83,29 @@ def async_retry(
             *args: P.args, **kwargs: P.kwargs
         ) -> T:
             retries = 0
-
-            # Extract device info for better logging if available
-            device_info = ""
-            if len(args) >= 3:  # Assuming (self, ip, device) pattern
-                try:
-                    ip = str(args[1])
-                    device = args[2]
-                    device_name = get_device_name(device)
-                    hostname = await get_hostname_cached(ip)
-                    device_info = f" for {device_name} (IP: {ip}, Hostname: {hostname})"
-                except Exception:
-                    device_info = (
-                        f" for device at {args[1] if len(args) > 1 else 'unknown'}"
-                    )
+            device_info = None  # Built on the first failure, only for logging
 
             while retries < max_retries:
                 try:
                     return await func(*args, **kwargs)
 
-                except (ConnectionError, TimeoutError, OSError) as e:
-                    logger.error(
-                        f"Network error during {operation_name}{device_info}: {e}"
-                    )
-
-                except (AttributeError, KeyError, ValueError) as e:
-                    logger.error(
-                        f"Data error during {operation_name}{device_info}: {e}"
-                    )
-
                 except Exception as e:
+                    last_error = e
+                    if device_info is None:
+                        device_info = _describe_device_call(args)
+                    if isinstance(e, (ConnectionError, TimeoutError, OSError)):
+                        error_kind = "Network error"
+                    elif isinstance(e, (AttributeError, KeyError, ValueError)):
+                        error_kind = "Data error"
+                    else:
+                        error_kind = "Unexpected error"
                     logger.error(
-                        f"Unexpected error during {operation_name}{device_info}: {e}"
+                        f"{error_kind} during {operation_name}{device_info}: {e}"
                     )
 
                 retries += 1
                 if retries < max_retries:
+                    get_metrics().increment("retries")
                     delay = base_delay * (2**retries if exponential_backoff else 1)
                     # Cap delay at maximum configured value to prevent excessive waits
                     delay = min(delay, Config.KASA_COLLECTOR_MAX_RETRY_DELAY)
@@ -113,18 +119,51 @@ def async_retry(
                         f"Max retries ({max_retries}) reached for "
                         f"{operation_name}{device_info}"
                     )
-                    raise
+                    raise last_error
 
             # This should never be reached, but satisfies type checkers
-            raise RuntimeError(
-                f"Unexpected end of retry loop in {operation_name}{device_info}"
-            )
+            raise RuntimeError(f"Unexpected end of retry loop in {operation_name}")
 
         return wrapper
 
     return decorator
 
 
+# Shared limit on device requests in flight, created on first use
+_request_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_request_semaphore() -> asyncio.Semaphore:
+    """
+    Get the global semaphore that caps concurrent device requests.
+    """
+    global _request_semaphore
+    if _request_semaphore is None:
+        _request_semaphore = asyncio.Semaphore(
+            Config.KASA_COLLECTOR_MAX_CONCURRENT_REQUESTS
+        )
+    return _request_semaphore
+
+
+def limit_concurrency(
+    func: Callable[P, Coroutine[Any, Any, T]],
+) -> Callable[P, Coroutine[Any, Any, T]]:
+    """
+    Run the decorated coroutine only while holding a slot of the shared
+    request semaphore, so polling and discovery together never have more
+    than KASA_COLLECTOR_MAX_CONCURRENT_REQUESTS device requests in flight.
+
+    Apply it inside async_retry so a slot is not held during retry backoff.
+    """
+
+    @wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        async with get_request_semaphore():
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
 class DeviceContext:
     """
     Context manager for device operations using Python 3.13 features.
@@ -136,11 +175,10 @@ class DeviceContext:
         self.ip = ip
         self.operation = operation
         self.device_name = get_device_name(device)
-        self.hostname = None
+        self.hostname = get_hostname_nowait(ip)
 
     async def __aenter__(self):
         """Async context manager entry with device preparation."""
-        self.hostname = await get_hostname_cached(self.ip)
         logger.debug(
             f"Starting {self.operation} for {self.device_name} (IP: {self.ip})"
         )
@@ -177,6 +215,37 @@ def format_duration(seconds: float) -> str:
     return f"{int(hours)} hours, {int(mins)} minutes, {secs:.1f} seconds"
 
 
+# Nanoseconds per unit of KASA_COLLECTOR_TIMESTAMP_PRECISION
+TIMESTAMP_PRECISION_NS = {"s": 1_000_000_000, "ms": 1_000_000, "us": 1_000, "ns": 1}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def sample_timestamp() -> int:
+    """
+    Return the timestamp for a sample read now, in nanoseconds since the
+    epoch. It is truncated to KASA_COLLECTOR_TIMESTAMP_PRECISION, or to the
+    start of the data fetch interval when KASA_COLLECTOR_ALIGN_TIMESTAMPS is
+    on, so every point of a reading shares one regular timestamp.
+    """
+    if Config.KASA_COLLECTOR_ALIGN_TIMESTAMPS:
+        step = Config.KASA_COLLECTOR_DATA_FETCH_INTERVAL * 1_000_000_000
+    else:
+        step = TIMESTAMP_PRECISION_NS[Config.KASA_COLLECTOR_TIMESTAMP_PRECISION]
+    now = time.time_ns()
+    return now - now % step
+
+
+def datetime_from_ns(timestamp: int) -> datetime:
+    """Convert nanoseconds since the epoch to a UTC datetime."""
+    return EPOCH + timedelta(microseconds=timestamp // 1000)
+
+
+def ns_from_datetime(value: datetime) -> int:
+    """Convert a timezone-aware datetime to nanoseconds since the epoch."""
+    return (value - EPOCH) // timedelta(microseconds=1) * 1000
+
+
 # Python 3.13 feature: Enhanced error handling with exception groups
 # Import ExceptionGroup from Python 3.11+
 try:
@@ -0,0 +1,208 @@
+"""
+Bounded queue between the poller and the storage backend.
+Decouples device polling from sink latency with a configurable overflow policy.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Optional
+
+import aiofiles
+from config import Config
+
+type QueueItem = dict[str, Any]  # {"kind": "emeter" | "sysinfo", "data": {...}}
+type QueueStats = dict[str, int]
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_SPILL = "spill"
+OVERFLOW_POLICIES = {OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_SPILL}
+
+
+class WriteQueue:
+    """
+    Bounded in-memory queue of collected samples waiting to be stored.
+
+    When the queue is full the overflow policy decides what happens:
+    - block: the producer waits until the writer makes room (backpressure)
+    - drop_oldest: the oldest queued sample is discarded
+    - spill: the new sample is appended to a file on disk and replayed once
+      the queue has room again
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        overflow_policy: Optional[str] = None,
+        spill_path: Optional[str] = None,
+    ):
+        if max_size is None:
+            max_size = Config.KASA_COLLECTOR_QUEUE_MAX_SIZE
+        if overflow_policy is None:
+            overflow_policy = Config.KASA_COLLECTOR_QUEUE_OVERFLOW_POLICY
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown queue overflow policy: {overflow_policy}")
+        if spill_path is None:
+            spill_path = os.path.join(
+                Config.KASA_COLLECTOR_SPOOL_DIR, "queue_overflow.jsonl"
+            )
+
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        self._queue: asyncio.Queue[QueueItem] = asyncio.Queue(maxsize=max_size)
+        self._spill_lock = asyncio.Lock()
+        self._spilled_pending = self._count_spilled()
+
+        # Counters exported through stats()
+        self.enqueued = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.high_water_mark = 0
+
+    def depth(self) -> int:
+        """Return the number of samples currently queued in memory."""
+        return self._queue.qsize()
+
+    async def put(self, item: QueueItem):
+        """
+        Add a sample to the queue, applying the overflow policy when full.
+        """
+        if self._queue.full() or (
+            self.overflow_policy == OVERFLOW_SPILL and self._spilled_pending
+        ):
+            if self.overflow_policy == OVERFLOW_BLOCK:
+                await self._queue.put(item)
+            elif self.overflow_policy == OVERFLOW_DROP_OLDEST:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning(
+                        f"Write queue full ({self.max_size} samples), "
+                        f"dropped {self.dropped} oldest samples so far"
+                    )
+                self._queue.put_nowait(item)
+            else:
+                # Keep spilling while older samples are still on disk so
+                # replay preserves their order
+                await self._spill(item)
+                return
+        else:
+            self._queue.put_nowait(item)
+
+        self.enqueued += 1
+        self.high_water_mark = max(self.high_water_mark, self._queue.qsize())
+
+    async def put_many(self, items: list[QueueItem]):
+        """
+        Add several samples back to back, so they reach the writer together.
+        """
+        for item in items:
+            await self.put(item)
+
+    async def get_batch(self, max_items: int, timeout: float) -> list[QueueItem]:
+        """
+        Wait up to timeout seconds for a sample, then drain up to max_items
+        queued samples without waiting further. Returns an empty list on timeout.
+        """
+        try:
+            first = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return []
+
+        batch = [first]
+        self._queue.task_done()
+        while len(batch) < max_items and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+            self._queue.task_done()
+        return batch
+
+    def drain_nowait(self) -> list[QueueItem]:
+        """Remove and return everything currently queued in memory."""
+        items = []
+        while not self._queue.empty():
+            items.append(self._queue.get_nowait())
+            self._queue.task_done()
+        return items
+
+    def _count_spilled(self) -> int:
+        """Count samples left in the overflow file by a previous run."""
+        try:
+            with open(self.spill_path, "r") as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.warning(f"Could not read overflow file {self.spill_path}: {e}")
+            return 0
+
+    async def _spill(self, item: QueueItem):
+        """Append a sample to the overflow file."""
+        try:
+            async with self._spill_lock:
+                os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+                async with aiofiles.open(self.spill_path, "a") as f:
+                    await f.write(json.dumps(item, default=str) + "\n")
+                self._spilled_pending += 1
+                self.spilled += 1
+        except Exception as e:
+            self.dropped += 1
+            logger.error(f"Failed to spill sample to {self.spill_path}: {e}")
+
+    async def replay_spilled(self):
+        """
+        Move spilled samples back into the queue once it is at most half full.
+        Samples that still do not fit are written back to the overflow file.
+        """
+        if not self._spilled_pending or self._queue.qsize() > self.max_size // 2:
+            return
+
+        async with self._spill_lock:
+            try:
+                async with aiofiles.open(self.spill_path, "r") as f:
+                    lines = await f.readlines()
+            except FileNotFoundError:
+                self._spilled_pending = 0
+                return
+            except Exception as e:
+                logger.error(f"Failed to read spilled samples: {e}")
+                return
+
+            free = self.max_size - self._queue.qsize()
+            replay, remaining = lines[:free], lines[free:]
+            for line in replay:
+                try:
+                    self._queue.put_nowait(json.loads(line))
+                    self.enqueued += 1
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Skipping corrupt spilled sample: {e}")
+
+            if remaining:
+                async with aiofiles.open(self.spill_path, "w") as f:
+                    await f.writelines(remaining)
+            else:
+                os.remove(self.spill_path)
+            self._spilled_pending = len(remaining)
+
+        logger.debug(
+            f"Replayed {len(replay)} spilled samples, {len(remaining)} remaining"
+        )
+
+    def stats(self) -> QueueStats:
+        """
+        Get queue statistics for export as self-monitoring metrics.
+        """
+        return {
+            "depth": self._queue.qsize(),
+            "max_size": self.max_size,
+            "high_water_mark": self.high_water_mark,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "spilled_pending": self._spilled_pending,
+        }